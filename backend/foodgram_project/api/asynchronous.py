@@ -0,0 +1,167 @@
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers import asgi
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+from .metrics import current
+
+STREAM_BUFFER = 16
+
+_executor = None
+_executor_lock = threading.Lock()
+_stream_end = object()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_DB_WORKERS,
+                thread_name_prefix='api-db',
+            )
+    return _executor
+
+
+def call_in_worker(func, *args, **kwargs):
+    """Выполняет func в потоке пула. Соединения с БД этого потока
+    закрываются по тем же правилам, что и после обычного запроса."""
+    close_old_connections()
+    try:
+        metrics = current.get()
+        if metrics is None:
+            return func(*args, **kwargs)
+        with metrics.track_queries():
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_pool(func, *args, **kwargs):
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(),
+        functools.partial(context.run, call_in_worker, func, *args, **kwargs),
+    )
+
+
+def respond(view, request, *args, **kwargs):
+    """Вызывает представление и сразу отрисовывает ответ, чтобы
+    в цикл событий не попала работа с БД. Потоковый ответ
+    перебирается позже, в ASGIHandler."""
+    response = view(request, *args, **kwargs)
+    if not getattr(response, 'is_rendered', True):
+        started = time.perf_counter()
+        response.render()
+        metrics = current.get()
+        if metrics is not None:
+            metrics.render_time = time.perf_counter() - started
+    return response
+
+
+def produce(iterator, queue, loop, stopped):
+    """Перебирает потоковый ответ в одном потоке пула, чтобы курсор
+    и соединение с БД не переходили между потоками, и передаёт части
+    в цикл событий. Останавливается, если их перестали забирать."""
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    try:
+        for part in iterator:
+            put(part)
+            if stopped.is_set():
+                return
+    except Exception as error:
+        put(error)
+    else:
+        put(_stream_end)
+
+
+async def stream_in_pool(iterator):
+    """Асинхронно отдаёт части потокового ответа по мере того, как
+    они готовы; в памяти держится не больше STREAM_BUFFER частей."""
+    queue = asyncio.Queue(maxsize=STREAM_BUFFER)
+    stopped = threading.Event()
+    producer = asyncio.ensure_future(run_in_pool(
+        produce, iterator, queue, asyncio.get_running_loop(), stopped
+    ))
+    try:
+        while True:
+            part = await queue.get()
+            if part is _stream_end:
+                break
+            if isinstance(part, Exception):
+                raise part
+            yield part
+    finally:
+        stopped.set()
+        while not queue.empty():
+            queue.get_nowait()
+        await producer
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """Обработчик Django 3.2 перебирает потоковый ответ синхронно,
+    прямо в цикле событий. Здесь части ответа готовятся в пуле потоков
+    и отправляются по одной, не собирая весь ответ в памяти."""
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [
+            (
+                header.encode('ascii') if isinstance(header, str) else header,
+                value.encode('latin1') if isinstance(value, str) else value,
+            )
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        parts = stream_in_pool(iter(response))
+        try:
+            async for part in parts:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+        finally:
+            await parts.aclose()
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+def as_async_view(view):
+    async def async_view(request, *args, **kwargs):
+        return await run_in_pool(respond, view, request, *args, **kwargs)
+
+    async_view.__name__ = view.__name__
+    async_view.__doc__ = view.__doc__
+    async_view.__dict__.update(view.__dict__)
+    return async_view
+
+
+def asynchronous(urls):
+    """Под ASGI (ASYNC_VIEWS) подменяет представления маршрутов
+    асинхронными обёртками над пулом потоков; под WSGI ничего не меняет."""
+    if settings.ASYNC_VIEWS:
+        for url in urls:
+            if isinstance(url, URLPattern):
+                url.callback = as_async_view(url.callback)
+    return urls
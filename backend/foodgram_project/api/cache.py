@@ -0,0 +1,136 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from recipes.versioning import get_version
+
+
+class ReferenceCache:
+    """Двухуровневый кеш справочных данных: LRU в памяти процесса
+    поверх кеша Django. Ключи содержат версию набора данных, поэтому
+    после её смены старые записи просто перестают запрашиваться."""
+
+    def __init__(self, version_name, maxsize=128):
+        self.version_name = version_name
+        self.maxsize = maxsize
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+
+    def version(self):
+        return get_version(self.version_name)
+
+    def get_or_set(self, key, default, version=None):
+        version = version or self.version()
+        full_key = f'reference:{self.version_name}:{version}:{key}'
+        with self.lock:
+            if full_key in self.local:
+                self.local.move_to_end(full_key)
+                return self.local[full_key]
+        value = cache.get(full_key)
+        if value is None:
+            value = default()
+            cache.set(full_key, value, settings.REFERENCE_CACHE_TIMEOUT)
+        with self.lock:
+            self.local[full_key] = value
+            while len(self.local) > self.maxsize:
+                self.local.popitem(last=False)
+        return value
+
+    def etag(self, key, version=None):
+        version = version or self.version()
+        digest = hashlib.md5(key.encode()).hexdigest()[:12]
+        return f'"{self.version_name}-{version}-{digest}"'
+
+
+tag_cache = ReferenceCache('tags')
+ingredient_cache = ReferenceCache('ingredients')
+
+
+def make_etag(*parts):
+    return '"{}"'.format(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def not_modified(request, etag, last_modified=None):
+    """Ответ 304 (или 412), если валидаторы клиента актуальны."""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is not None and etag:
+        response['ETag'] = etag
+    return response
+
+
+class ReferenceCacheMixin:
+    """list и retrieve отдают данные из reference_cache с ETag
+    и отвечают 304, если клиент прислал актуальный If-None-Match.
+    Ключи не зависят от посторонних параметров запроса, чтобы ими
+    нельзя было засорить кеш."""
+
+    reference_cache = None
+
+    def cached_response(self, request, key, build, store=True):
+        version = self.reference_cache.version()
+        etag = self.reference_cache.etag(key, version)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        if store:
+            data = self.reference_cache.get_or_set(key, build, version)
+        else:
+            data = build()
+        return Response(data, headers={'ETag': etag})
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request,
+            'list',
+            lambda: [
+                dict(item) for item in self.get_serializer(
+                    self.filter_queryset(self.get_queryset()), many=True
+                ).data
+            ],
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(
+            request,
+            f'detail:{lookup}',
+            lambda: dict(self.get_serializer(self.get_object()).data),
+        )
+
+
+class ConditionalGetMixin:
+    """list и retrieve сверяют ETag и Last-Modified из get_validators
+    до выборки и сериализации данных."""
+
+    def get_validators(self, request):
+        """Возвращает пару (etag, last_modified) или (None, None)."""
+        raise NotImplementedError
+
+    def conditional(self, handler, request, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,96 @@
+import csv
+import logging
+
+from django.conf import settings
+
+from .pdf import PDFStreamWriter, load_font
+
+logger = logging.getLogger(__name__)
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class ShoppingListExporter:
+    format = None
+    content_type = None
+
+    def __init__(self, ingredients):
+        self.ingredients = ingredients
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    @staticmethod
+    def line(ingredient):
+        return (
+            f"{ingredient['name']} - {ingredient['amount']} "
+            f"{ingredient['measurement_unit']}"
+        )
+
+    def __iter__(self):
+        raise NotImplementedError
+
+
+class TextExporter(ShoppingListExporter):
+    format = 'txt'
+    content_type = 'text/plain; charset=utf-8'
+
+    def __iter__(self):
+        for ingredient in self.ingredients:
+            yield f'{self.line(ingredient)}\n'.encode()
+
+
+class CSVExporter(ShoppingListExporter):
+    format = 'csv'
+    content_type = 'text/csv; charset=utf-8'
+
+    def __iter__(self):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('name', 'measurement_unit', 'amount')
+        ).encode()
+        for ingredient in self.ingredients:
+            yield writer.writerow((
+                ingredient['name'],
+                ingredient['measurement_unit'],
+                ingredient['amount'],
+            )).encode()
+
+
+class PDFExporter(ShoppingListExporter):
+    format = 'pdf'
+    content_type = 'application/pdf'
+
+    @classmethod
+    def is_available(cls):
+        return load_font(settings.SHOPPING_LIST_FONT) is not None
+
+    def __iter__(self):
+        return iter(PDFStreamWriter(
+            (self.line(ingredient) for ingredient in self.ingredients),
+            font_path=settings.SHOPPING_LIST_FONT,
+            title='Список покупок',
+        ))
+
+
+EXPORTERS = {
+    exporter.format: exporter
+    for exporter in (TextExporter, CSVExporter, PDFExporter)
+}
+
+
+def get_exporter(export_format):
+    """Выгрузка в нужном формате. PDF без шрифта с кириллицей нечитаем,
+    поэтому в этом случае отдаётся текстовый список."""
+    exporter = EXPORTERS.get(export_format)
+    if exporter is None or exporter.is_available():
+        return exporter
+    logger.warning(
+        'Выгрузка в формате %s недоступна, отдаётся текстовый список.',
+        export_format,
+    )
+    return TextExporter
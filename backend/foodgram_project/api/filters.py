@@ -1,5 +1,5 @@
 from django_filters import rest_framework as filter
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import OrderingFilter
 
 from recipes.models import Recipe, Tag
 
@@ -31,5 +31,18 @@ class RecipeFilter(filter.FilterSet):
         return queryset
 
 
-class IngredientNameFilter(SearchFilter):
-    search_param = 'name'
+class RecipeOrderingFilter(OrderingFilter):
+    """?ordering=-favorites_count и т. п.; при равных значениях рецепты
+    идут от новых к старым, чтобы страницы не пересекались."""
+
+    tie_breakers = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering is None:
+            return None
+        fields = {field.lstrip('-') for field in ordering}
+        return (*ordering, *(
+            field for field in self.tie_breakers
+            if field.lstrip('-') not in fields
+        ))
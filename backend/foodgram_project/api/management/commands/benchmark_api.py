@@ -0,0 +1,235 @@
+import json
+import random
+import statistics
+import subprocess
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, rank):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(rank / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет основные эндпоинты API тестовым клиентом Django '
+        'и выводит перцентили времени ответа и число запросов к БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Число замеров на каждый эндпоинт.',
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Число прогревочных запросов без замера.',
+        )
+        parser.add_argument(
+            '--only', nargs='*', default=None,
+            help='Запустить только эти эндпоинты.',
+        )
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument(
+            '--output', help='Сохранить результаты в JSON-файл.',
+        )
+        parser.add_argument(
+            '--compare', help='Сравнить с результатами из JSON-файла.',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        user = User.objects.annotate(
+            activity=Count('shopping_cart', distinct=True)
+            + Count('followers', distinct=True)
+        ).order_by('-activity').first()
+        recipe_ids = list(Recipe.objects.values_list('pk', flat=True)[:1000])
+        if user is None or not recipe_ids:
+            raise CommandError(
+                'Нет данных: сначала запустите generate_data.'
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        endpoints = self.endpoints(user, recipe_ids)
+        if options['only']:
+            unknown = set(options['only']) - endpoints.keys()
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}. '
+                    f'Доступны: {", ".join(endpoints)}.'
+                )
+            endpoints = {name: endpoints[name] for name in options['only']}
+        results = {}
+        self.stdout.write(
+            f'{"endpoint":<24}{"p50":>8}{"p90":>8}{"p95":>8}{"p99":>8}'
+            f'{"queries":>9}{"kB":>8}'
+        )
+        for name, make_url in endpoints.items():
+            for _ in range(options['warmup']):
+                self.request(make_url())
+            samples = [
+                self.request(make_url()) for _ in range(options['requests'])
+            ]
+            results[name] = self.summarize(samples)
+            self.print_row(name, results[name])
+        report = {
+            'revision': git_revision(),
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'dataset': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+            },
+            'requests': options['requests'],
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def endpoints(self, user, recipe_ids):
+        tag = Tag.objects.annotate(
+            total=Count('recipes')
+        ).order_by('-total').first()
+        author = User.objects.annotate(
+            total=Count('recipes')
+        ).order_by('-total').first()
+        names = list(Ingredient.objects.values_list('name', flat=True)[:500])
+        ingredient_ids = list(
+            Ingredient.objects.values_list('pk', flat=True)[:500]
+        )
+        endpoints = {
+            'recipes': lambda: '/api/recipes/',
+            'recipes_page': lambda: (
+                f'/api/recipes/?page={self.rng.randint(1, 20)}'
+            ),
+            'recipes_author': lambda: f'/api/recipes/?author={author.pk}',
+            'recipes_popular': lambda: (
+                '/api/recipes/?ordering=-favorites_count'
+            ),
+            'recipes_favorited': lambda: '/api/recipes/?is_favorited=1',
+            'recipes_cart': lambda: '/api/recipes/?is_in_shopping_cart=1',
+            'recipe_detail': lambda: (
+                f'/api/recipes/{self.rng.choice(recipe_ids)}/'
+            ),
+            'subscriptions': lambda: (
+                '/api/users/subscriptions/?recipes_limit=3'
+            ),
+            'download': lambda: '/api/recipes/download_shopping_cart/',
+            'recommended': lambda: '/api/recipes/recommended/',
+            'timeline': lambda: '/api/recipes/timeline/',
+        }
+        if tag is not None:
+            endpoints['recipes_tag'] = lambda: f'/api/recipes/?tags={tag.slug}'
+        if ingredient_ids:
+            endpoints['recipes_by_ingredients'] = lambda: (
+                '/api/recipes/by_ingredients/?ingredients=' + ','.join(
+                    str(pk) for pk in self.rng.sample(
+                        ingredient_ids, min(8, len(ingredient_ids))
+                    )
+                )
+            )
+        if names:
+            endpoints['ingredient_search'] = lambda: (
+                f'/api/ingredients/?name={self.rng.choice(names)[:3]}'
+            )
+        return endpoints
+
+    def request(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(url)
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+            elapsed = time.perf_counter() - started
+        return {
+            'ms': elapsed * 1000,
+            'queries': len(queries),
+            'bytes': size,
+            'status': response.status_code,
+        }
+
+    def summarize(self, samples):
+        times = [sample['ms'] for sample in samples]
+        queries = [sample['queries'] for sample in samples]
+        summary = {
+            f'p{rank}': round(percentile(times, rank), 3)
+            for rank in PERCENTILES
+        }
+        summary.update(
+            mean=round(statistics.mean(times), 3),
+            max=round(max(times), 3),
+            queries_mean=round(statistics.mean(queries), 2),
+            queries_max=max(queries),
+            bytes_mean=round(statistics.mean(
+                sample['bytes'] for sample in samples
+            )),
+            statuses=sorted({sample['status'] for sample in samples}),
+        )
+        return summary
+
+    def print_row(self, name, result):
+        self.stdout.write(
+            f'{name:<24}{result["p50"]:>8.1f}{result["p90"]:>8.1f}'
+            f'{result["p95"]:>8.1f}{result["p99"]:>8.1f}'
+            f'{result["queries_mean"]:>9.1f}'
+            f'{result["bytes_mean"] / 1024:>8.1f}'
+        )
+        if result['statuses'] != [200]:
+            self.stdout.write(self.style.WARNING(
+                f'  статусы ответов: {result["statuses"]}'
+            ))
+
+    def compare(self, path, results):
+        try:
+            with open(path, encoding='utf-8') as previous_file:
+                previous = json.load(previous_file)['endpoints']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        self.stdout.write(
+            f'\n{"endpoint":<24}{"p95 было":>10}{"стало":>8}{"Δ%":>8}'
+            f'{"запросов было":>15}{"стало":>8}'
+        )
+        for name, result in results.items():
+            before = previous.get(name)
+            if before is None:
+                continue
+            delta = (result['p95'] / before['p95'] - 1) * 100 if (
+                before['p95']
+            ) else 0
+            line = (
+                f'{name:<24}{before["p95"]:>10.1f}{result["p95"]:>8.1f}'
+                f'{delta:>+8.1f}{before["queries_mean"]:>15.1f}'
+                f'{result["queries_mean"]:>8.1f}'
+            )
+            if result['queries_mean'] > before['queries_mean'] or delta > 20:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
@@ -0,0 +1,89 @@
+import base64
+import io
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIRequestFactory
+
+from api.serializers import RecipeCreateUpdateSerializer
+from recipes.models import Ingredient, Tag
+from users.models import User
+
+
+def image_payload():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(buffer, format='PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает, сколько запросов к БД стоит создание и обновление '
+        'рецепта в зависимости от числа ингредиентов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1,5,10,25,50',
+            help='Числа ингредиентов через запятую.',
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(f'{"ingredients":>12} {"create":>8} {"update":>8}')
+        with transaction.atomic():
+            author = User.objects.create(
+                username='benchmark-author', email='benchmark@foodgram.local'
+            )
+            tag = Tag.objects.create(
+                name='benchmark', color='#BE0C47', slug='benchmark'
+            )
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'benchmark {index}', measurement_unit='г')
+                for index in range(max(sizes) * 2)
+            )
+            ids = list(Ingredient.objects.filter(
+                name__startswith='benchmark '
+            ).values_list('id', flat=True))
+            request = APIRequestFactory().post('/api/recipes/')
+            request.user = author
+            for size in sizes:
+                create_queries, recipe = self.measure(request, None, {
+                    'tags': [tag.id],
+                    'ingredients': [
+                        {'id': ingredient_id, 'amount': 10}
+                        for ingredient_id in ids[:size]
+                    ],
+                })
+                update_queries, _ = self.measure(request, recipe, {
+                    'tags': [tag.id],
+                    'ingredients': [
+                        {'id': ingredient_id, 'amount': 20}
+                        for ingredient_id in ids[size // 2:size + size // 2]
+                    ],
+                })
+                recipe.image.delete(save=False)
+                self.stdout.write(
+                    f'{size:>12} {create_queries:>8} {update_queries:>8}'
+                )
+            transaction.set_rollback(True)
+
+    def measure(self, request, instance, data):
+        data = {
+            'name': 'benchmark',
+            'text': 'benchmark',
+            'cooking_time': 10,
+            'image': image_payload(),
+            **data,
+        }
+        serializer = RecipeCreateUpdateSerializer(
+            instance, data=data, context={'request': request}
+        )
+        with CaptureQueriesContext(connection) as queries:
+            serializer.is_valid(raise_exception=True)
+            recipe = serializer.save()
+        return len(queries), recipe
@@ -0,0 +1,55 @@
+import gzip
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from api.views import RecipeViewSet
+
+LIGHT_FIELDS = 'id,name,image,thumbnail,cooking_time,is_favorited'
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает размер страниц списка рецептов (как есть и в gzip) '
+        'для разных размеров страницы и наборов полей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limits',
+            default='6,20,50',
+            help='Размеры страницы через запятую.',
+        )
+        parser.add_argument(
+            '--fields',
+            action='append',
+            default=None,
+            help=(
+                'Значение ?fields=; можно указать несколько раз. '
+                f'По умолчанию: все поля и {LIGHT_FIELDS}.'
+            ),
+        )
+
+    def handle(self, *args, **options):
+        limits = [int(limit) for limit in options['limits'].split(',')]
+        projections = options['fields'] or ['', LIGHT_FIELDS]
+        view = RecipeViewSet.as_view({'get': 'list'})
+        factory = APIRequestFactory()
+        self.stdout.write(
+            f'{"limit":>6} {"bytes":>10} {"gzip":>10} {"per recipe":>11}  '
+            'fields'
+        )
+        for projection in projections:
+            for limit in limits:
+                params = {'limit': limit}
+                if projection:
+                    params['fields'] = projection
+                response = view(factory.get('/api/recipes/', params))
+                response.render()
+                size = len(response.content)
+                compressed = len(gzip.compress(response.content))
+                count = max(len(response.data.get('results', ())), 1)
+                self.stdout.write(
+                    f'{limit:>6} {size:>10} {compressed:>10} '
+                    f'{size // count:>11}  {projection or "все"}'
+                )
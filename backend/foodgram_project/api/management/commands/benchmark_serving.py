@@ -0,0 +1,365 @@
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe
+from users.models import User
+
+from .benchmark_api import git_revision, percentile
+
+APPLICATIONS = {
+    'wsgi': ('foodgram.wsgi:application',),
+    'asgi': (
+        'foodgram.asgi:application',
+        '--worker-class', 'uvicorn.workers.UvicornWorker',
+    ),
+}
+PERCENTILES = (50, 95, 99)
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def resident_memory(pid):
+    """Резидентная память процесса в мегабайтах (Linux, /proc)."""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def child_pids(parent):
+    children = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as stat:
+                ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == parent:
+            children.append(int(name))
+    return children
+
+
+class Server:
+    """gunicorn в отдельном процессе: синхронные воркеры для WSGI
+    или воркеры uvicorn для ASGI."""
+
+    def __init__(self, mode, workers):
+        self.mode = mode
+        self.workers = workers
+        self.port = free_port()
+        self.log = tempfile.TemporaryFile()
+        self.process = None
+
+    def __enter__(self):
+        env = dict(
+            os.environ,
+            ASYNC_VIEWS='true' if self.mode == 'asgi' else 'false',
+            METRICS_LOG_LEVEL='WARNING',
+        )
+        self.process = subprocess.Popen(
+            (
+                sys.executable, '-m', 'gunicorn',
+                *APPLICATIONS[self.mode],
+                '--workers', str(self.workers),
+                '--bind', f'127.0.0.1:{self.port}',
+                '--log-level', 'warning',
+            ),
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=self.log,
+        )
+        self.wait_ready()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                connection = http.client.HTTPConnection(
+                    '127.0.0.1', self.port, timeout=5
+                )
+                connection.request('GET', '/api/tags/')
+                status = connection.getresponse().status
+                connection.close()
+                if status == 200:
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.log.seek(0)
+        tail = self.log.read().decode(errors='replace')[-2000:]
+        raise CommandError(f'{self.mode}: сервер не запустился.\n{tail}')
+
+    def worker_memory(self):
+        return sum(
+            resident_memory(pid) for pid in child_pids(self.process.pid)
+        )
+
+
+class Load:
+    """Быстрые клиенты с keep-alive шлют запросы без пауз, медленные
+    передают заголовки по строке с задержкой, как клиенты
+    на плохой мобильной сети."""
+
+    def __init__(self, port, targets, headers, seed):
+        self.port = port
+        self.targets = targets
+        self.headers = headers
+        self.seed = seed
+        self.samples = []
+        self.errors = 0
+        self.slow_done = 0
+
+    def run(self, concurrency, duration, slow_clients=0, slow_delay=0.5):
+        self.deadline = time.monotonic() + duration
+        threads = [
+            threading.Thread(target=self.fast_client, args=(index,))
+            for index in range(concurrency)
+        ] + [
+            threading.Thread(target=self.slow_client, args=(slow_delay,))
+            for _ in range(slow_clients)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - started
+
+    def connect(self):
+        return http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+
+    def fast_client(self, index):
+        rng = random.Random(f'{self.seed}-{index}')
+        connection = self.connect()
+        while time.monotonic() < self.deadline:
+            started = time.perf_counter()
+            try:
+                connection.request(
+                    'GET', rng.choice(self.targets), headers=self.headers
+                )
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                connection.close()
+                connection = self.connect()
+                continue
+            if response.status >= 500:
+                self.errors += 1
+            self.samples.append((time.perf_counter() - started) * 1000)
+        connection.close()
+
+    def slow_client(self, delay):
+        lines = [
+            'GET /api/recipes/download_shopping_cart/ HTTP/1.1',
+            f'Host: 127.0.0.1:{self.port}',
+            *(f'{name}: {value}' for name, value in self.headers.items()),
+            'Connection: close',
+        ]
+        while time.monotonic() < self.deadline:
+            try:
+                with socket.create_connection(
+                    ('127.0.0.1', self.port), timeout=60
+                ) as sock:
+                    for line in lines:
+                        sock.sendall(f'{line}\r\n'.encode())
+                        time.sleep(delay)
+                    sock.sendall(b'\r\n')
+                    while sock.recv(65536):
+                        pass
+                self.slow_done += 1
+            except OSError:
+                self.errors += 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность и хвосты задержек API '
+        'под gunicorn в режимах WSGI и ASGI (uvicorn) при равной '
+        'памяти воркеров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modes', nargs='+', choices=sorted(APPLICATIONS),
+            default=['wsgi', 'asgi'],
+        )
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Число воркеров в каждом режиме, если не задан --memory.',
+        )
+        parser.add_argument(
+            '--memory', type=float, default=None,
+            help='Бюджет памяти воркеров в МБ: число воркеров каждого '
+                 'режима подбирается по замеру памяти одного воркера.',
+        )
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность замера в секундах.',
+        )
+        parser.add_argument(
+            '--warmup', type=float, default=2,
+            help='Длительность прогрева в секундах.',
+        )
+        parser.add_argument(
+            '--slow-clients', type=int, default=0,
+            help='Число клиентов, медленно передающих заголовки.',
+        )
+        parser.add_argument('--slow-delay', type=float, default=0.5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', help='Сохранить результаты в JSON-файл.',
+        )
+
+    def handle(self, *args, **options):
+        if not os.path.isdir('/proc'):
+            raise CommandError(
+                'Замер памяти воркеров возможен только в Linux.'
+            )
+        self.options = options
+        user = User.objects.annotate(
+            activity=Count('shopping_cart', distinct=True)
+            + Count('followers', distinct=True)
+        ).order_by('-activity').first()
+        if user is None or not Recipe.objects.exists():
+            raise CommandError('Нет данных: сначала запустите generate_data.')
+        token, _ = Token.objects.get_or_create(user=user)
+        self.headers = {'Authorization': f'Token {token.key}'}
+        self.targets = self.make_targets(random.Random(options['seed']))
+        self.stdout.write(
+            f'{"mode":<6}{"workers":>8}{"RSS, МБ":>9}{"req/s":>9}'
+            + ''.join(f'{f"p{rank}":>8}' for rank in PERCENTILES)
+            + f'{"max":>9}{"errors":>8}{"slow":>6}'
+        )
+        results = {}
+        for mode in options['modes']:
+            results[mode] = self.measure(mode, self.workers_for(mode))
+            self.print_row(mode, results[mode])
+        if options['output']:
+            report = {
+                'revision': git_revision(),
+                'created': timezone.now().isoformat(),
+                'options': {
+                    key: options[key] for key in (
+                        'workers', 'memory', 'concurrency', 'duration',
+                        'slow_clients', 'slow_delay',
+                    )
+                },
+                'modes': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+
+    def make_targets(self, rng):
+        recipe_ids = list(Recipe.objects.values_list('pk', flat=True)[:1000])
+        names = list(Ingredient.objects.values_list('name', flat=True)[:500])
+        targets = [
+            '/api/recipes/',
+            '/api/recipes/?page=2',
+            '/api/tags/',
+            '/api/users/subscriptions/?recipes_limit=3',
+            '/api/recipes/download_shopping_cart/',
+        ]
+        targets += [
+            f'/api/recipes/{recipe_id}/'
+            for recipe_id in rng.sample(recipe_ids, min(20, len(recipe_ids)))
+        ]
+        targets += [
+            f'/api/ingredients/?name={quote(name[:3])}'
+            for name in rng.sample(names, min(20, len(names)))
+        ]
+        return targets
+
+    def workers_for(self, mode):
+        if self.options['memory'] is None:
+            return self.options['workers']
+        with Server(mode, 1) as server:
+            Load(server.port, self.targets, self.headers, 'calibrate').run(
+                self.options['concurrency'], self.options['warmup']
+            )
+            per_worker = server.worker_memory()
+        return max(1, int(self.options['memory'] // per_worker))
+
+    def measure(self, mode, workers):
+        options = self.options
+        with Server(mode, workers) as server:
+            Load(server.port, self.targets, self.headers, 'warmup').run(
+                options['concurrency'], options['warmup']
+            )
+            load = Load(
+                server.port, self.targets, self.headers, options['seed']
+            )
+            elapsed = load.run(
+                options['concurrency'], options['duration'],
+                options['slow_clients'], options['slow_delay'],
+            )
+            memory = server.worker_memory()
+        samples = load.samples or [0.0]
+        result = {
+            'workers': workers,
+            'memory_mb': round(memory, 1),
+            'requests': len(load.samples),
+            'rps': round(len(load.samples) / elapsed, 1),
+            'mean': round(statistics.mean(samples), 3),
+            'max': round(max(samples), 3),
+            'errors': load.errors,
+            'slow_requests': load.slow_done,
+        }
+        result.update(
+            (f'p{rank}', round(percentile(samples, rank), 3))
+            for rank in PERCENTILES
+        )
+        result['rps_per_100mb'] = round(
+            result['rps'] / memory * 100, 1
+        ) if memory else None
+        return result
+
+    def print_row(self, mode, result):
+        self.stdout.write(
+            f'{mode:<6}{result["workers"]:>8}{result["memory_mb"]:>9.0f}'
+            f'{result["rps"]:>9.1f}'
+            + ''.join(
+                f'{result[f"p{rank}"]:>8.1f}' for rank in PERCENTILES
+            )
+            + f'{result["max"]:>9.1f}{result["errors"]:>8}'
+            f'{result["slow_requests"]:>6}'
+        )
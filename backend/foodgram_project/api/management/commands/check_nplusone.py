@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from api.testing import (GrowingDataset, clients_for, endpoints,
+                         isolated_caches, measure)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Ищет N+1: прогоняет эндпоинты API и списки админки на двух '
+        'объёмах данных и завершается с ошибкой, если число запросов '
+        'к БД растёт вместе с числом строк. То же проверяет '
+        'api.tests.NPlusOneTest; команда нужна для отчёта по всем '
+        'эндпоинтам сразу.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--small', type=int, default=3)
+        parser.add_argument('--large', type=int, default=9)
+
+    def handle(self, *args, **options):
+        if not 0 < options['small'] < options['large']:
+            raise CommandError('Нужно 0 < --small < --large.')
+        with override_settings(
+            CACHES=isolated_caches('check-nplusone'), METRICS_ENABLED=False
+        ):
+            with transaction.atomic():
+                failures = self.run(options['small'], options['large'])
+                transaction.set_rollback(True)
+        if failures:
+            raise CommandError(
+                f'Число запросов растёт с объёмом данных: '
+                f'{", ".join(failures)}.'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Число запросов не зависит от объёма данных.'
+        ))
+
+    def run(self, small, large):
+        viewer = User.objects.create_superuser(
+            username='nplusone-viewer',
+            email='nplusone-viewer@foodgram.local',
+            password=None,
+        )
+        dataset = GrowingDataset(viewer, 'nplusone')
+        clients = clients_for(viewer)
+        urls = endpoints()
+        dataset.grow(small)
+        before = {
+            name: self.measure(clients[client], url)
+            for name, (client, url) in urls.items()
+        }
+        dataset.grow(large)
+        failures = []
+        for name, (client, url) in urls.items():
+            after = self.measure(clients[client], url)
+            if after.total <= before[name].total:
+                self.stdout.write(
+                    f'{name}: {before[name].total} → {after.total} '
+                    f'запросов, OK'
+                )
+                continue
+            failures.append(name)
+            self.stdout.write(self.style.ERROR(
+                f'{name}: {before[name].total} запросов при {small} '
+                f'авторах, {after.total} при {large}'
+            ))
+            for line in after.growth(before[name]):
+                self.stdout.write(line)
+        return failures
+
+    @staticmethod
+    def measure(client, url):
+        response, log = measure(client, url)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: ответ {response.status_code}.')
+        return log
@@ -0,0 +1,152 @@
+import random
+import re
+from itertools import combinations
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+
+from api.filters import RecipeFilter
+from recipes.models import (FavoriteRecipes, Recipe, RecipeTag, ShoppingCart,
+                            Tag)
+from users.models import User
+
+FILTERS = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+SEQUENTIAL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)\b(?! USING)'),
+}
+SMALL_TABLES = {'recipes_tag', 'users_user'}
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет через EXPLAIN, что все комбинации фильтров RecipeFilter '
+        'читают данные по индексам, а не полным просмотром таблиц.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Создать N синтетических рецептов на время проверки.',
+        )
+        parser.add_argument(
+            '--allow',
+            nargs='*',
+            default=sorted(SMALL_TABLES),
+            help='Таблицы, для которых полный просмотр допустим.',
+        )
+
+    def handle(self, *args, **options):
+        pattern = SEQUENTIAL_SCAN.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(
+                f'EXPLAIN для {connection.vendor} не поддерживается.'
+            )
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'])
+            failures = self.check_plans(pattern, set(options['allow']))
+            transaction.set_rollback(True)
+        if failures:
+            raise CommandError(
+                f'Полный просмотр таблиц в {failures} комбинациях фильтров.'
+            )
+        self.stdout.write(
+            self.style.SUCCESS('Все фильтры используют индексы.')
+        )
+
+    def check_plans(self, pattern, allowed):
+        user = User.objects.annotate(
+            activity=Count('favorites') + Count('shopping_cart')
+        ).order_by('-activity').first()
+        author = User.objects.annotate(
+            total=Count('recipes')
+        ).order_by('-total').first()
+        tag = Tag.objects.annotate(
+            total=Count('recipes')
+        ).order_by('-total').first()
+        if user is None or tag is None:
+            raise CommandError(
+                'Нет данных для проверки: запустите команду с --seed.'
+            )
+        values = {
+            'tags': [tag.slug],
+            'author': str(author.pk),
+            'is_favorited': 'true',
+            'is_in_shopping_cart': 'true',
+        }
+        request = SimpleNamespace(user=user)
+        page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        failures = 0
+        for size in range(len(FILTERS) + 1):
+            for names in combinations(FILTERS, size):
+                data = {name: values[name] for name in names}
+                queryset = RecipeFilter(
+                    data, queryset=Recipe.objects.all(), request=request
+                ).qs
+                plan = queryset[:page_size].explain()
+                scans = sorted(set(pattern.findall(plan)) - allowed)
+                label = ', '.join(names) or 'без фильтров'
+                if scans:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(
+                        f'{label}: полный просмотр {", ".join(scans)}'
+                    ))
+                    self.stdout.write(plan)
+                else:
+                    self.stdout.write(f'{label}: OK')
+        return failures
+
+    def seed(self, count):
+        User.objects.bulk_create(
+            User(username=f'explain-{index}', email=f'explain-{index}@x.ru')
+            for index in range(max(10, count // 20))
+        )
+        users = list(User.objects.filter(username__startswith='explain-'))
+        tags = list(Tag.objects.all()) or [
+            Tag.objects.create(name='explain', color='#000001', slug='explain')
+        ]
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=random.choice(users),
+                    name=f'explain {index}',
+                    image='recipes/explain.png',
+                    text='explain',
+                    cooking_time=10,
+                )
+                for index in range(count)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        recipe_ids = list(Recipe.objects.filter(
+            name__startswith='explain '
+        ).values_list('id', flat=True))
+        RecipeTag.objects.bulk_create(
+            (
+                RecipeTag(recipe_id=recipe_id, tags=random.choice(tags))
+                for recipe_id in recipe_ids
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        for model in (FavoriteRecipes, ShoppingCart):
+            model.objects.bulk_create(
+                (
+                    model(user=user, recipe_id=recipe_id)
+                    for user in users
+                    for recipe_id in random.sample(
+                        recipe_ids, min(len(recipe_ids), 20)
+                    )
+                ),
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
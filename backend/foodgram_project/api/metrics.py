@@ -0,0 +1,355 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import Http404, JsonResponse
+
+logger = logging.getLogger('foodgram.metrics')
+
+TIME_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+WORKER_KEY = 'metrics:worker:{}'
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+SPACES = re.compile(r'\s+')
+
+current = ContextVar('request_metrics', default=None)
+
+
+def fingerprint(sql):
+    """Текст запроса без значений: одинаковый для повторов N+1."""
+    return SPACES.sub(' ', IN_LIST.sub('IN (...)', sql)).strip()
+
+
+class RequestMetrics:
+    """Замеры одного запроса: SQL, сериализация и отрисовка ответа."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.render_started = None
+        self.render_time = 0.0
+        self.fingerprints = Counter()
+        self.depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    @contextmanager
+    def track_queries(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.execute))
+            yield
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def duplicates(self):
+        threshold = settings.METRICS_DUPLICATE_THRESHOLD
+        return [
+            {'sql': sql[:300], 'count': count}
+            for sql, count in self.fingerprints.most_common(5)
+            if count >= threshold
+        ]
+
+    def server_timing(self):
+        return ', '.join((
+            f'total;dur={self.elapsed * 1000:.1f}',
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} sql"',
+            f'serializer;dur={self.serializer_time * 1000:.1f}',
+            f'render;dur={self.render_time * 1000:.1f}',
+        ))
+
+
+@contextmanager
+def measure_serializer():
+    """Время сериализации; вложенные вызовы учитываются один раз."""
+    metrics = current.get()
+    if metrics is None or metrics.depth:
+        yield
+        return
+    metrics.depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.depth -= 1
+        metrics.serializer_time += time.perf_counter() - started
+
+
+class TimedSerializerMixin:
+
+    def to_representation(self, instance):
+        with measure_serializer():
+            return super().to_representation(instance)
+
+
+class Histogram:
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def snapshot(self):
+        return {
+            'buckets': list(self.buckets),
+            'counts': list(self.counts),
+            'sum': round(self.total, 3),
+        }
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = Histogram()
+        self.sql_ms = Histogram()
+        self.serializer_ms = Histogram()
+        self.sql_count = 0
+        self.duplicate_queries = 0
+        self.bytes = 0
+        self.statuses = Counter()
+
+    def observe(self, record):
+        self.count += 1
+        self.total_ms.observe(record['total_ms'])
+        self.sql_ms.observe(record['sql_ms'])
+        self.serializer_ms.observe(record['serializer_ms'])
+        self.sql_count += record['sql_count']
+        self.duplicate_queries += sum(
+            duplicate['count'] - 1 for duplicate in record['duplicates']
+        )
+        self.bytes += record['bytes'] or 0
+        self.statuses[str(record['status'])] += 1
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'total_ms': self.total_ms.snapshot(),
+            'sql_ms': self.sql_ms.snapshot(),
+            'serializer_ms': self.serializer_ms.snapshot(),
+            'sql_count': self.sql_count,
+            'duplicate_queries': self.duplicate_queries,
+            'bytes': self.bytes,
+            'statuses': dict(self.statuses),
+        }
+
+
+class Registry:
+    """Гистограммы по именам URL в памяти процесса. Снимок периодически
+    сохраняется в общий кеш, чтобы эндпоинт метрик видел все воркеры.
+    Каждый воркер пишет в свой слот metrics:worker:{n}; слот занимается
+    через cache.add и истекает через METRICS_WORKER_TIMEOUT, так что
+    слоты остановленных воркеров освобождаются сами."""
+
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.flushed = time.monotonic()
+        self.worker = None
+        self.slot = None
+
+    def observe(self, name, record):
+        with self.lock:
+            self.endpoints.setdefault(name, EndpointStats()).observe(record)
+            flush = (
+                time.monotonic() - self.flushed
+                >= settings.METRICS_FLUSH_INTERVAL
+            )
+            if flush:
+                self.flushed = time.monotonic()
+                snapshot = self.snapshot()
+        if flush:
+            self.flush(snapshot)
+
+    def snapshot(self):
+        return {
+            name: stats.snapshot() for name, stats in self.endpoints.items()
+        }
+
+    def flush(self, snapshot):
+        with self.flush_lock:
+            if self.worker is None or self.worker[0] != os.getpid():
+                self.worker = (os.getpid(), uuid4().hex)
+                self.slot = None
+            value = {'worker': self.worker, 'snapshot': snapshot}
+            timeout = settings.METRICS_WORKER_TIMEOUT
+            if self.slot is not None:
+                key = WORKER_KEY.format(self.slot)
+                owner = cache.get(key)
+                if owner is not None and owner['worker'] == self.worker:
+                    cache.set(key, value, timeout)
+                    return
+            for slot in range(settings.METRICS_WORKER_SLOTS):
+                if cache.add(WORKER_KEY.format(slot), value, timeout):
+                    self.slot = slot
+                    return
+            self.slot = None
+            logger.warning(
+                'Все %s слотов метрик заняты, снимок воркера %s не сохранён.',
+                settings.METRICS_WORKER_SLOTS, self.worker[0],
+            )
+
+    def collect(self):
+        self.flush(self.snapshot())
+        values = cache.get_many([
+            WORKER_KEY.format(slot)
+            for slot in range(settings.METRICS_WORKER_SLOTS)
+        ])
+        merged = {}
+        for value in values.values():
+            for name, stats in value['snapshot'].items():
+                merged[name] = merge(merged.get(name), stats)
+        return merged
+
+
+def merge(left, right):
+    if left is None:
+        return right
+    result = {}
+    for key, value in left.items():
+        other = right[key]
+        if isinstance(value, dict) and 'counts' in value:
+            result[key] = {
+                'buckets': value['buckets'],
+                'counts': [
+                    a + b for a, b in zip(value['counts'], other['counts'])
+                ],
+                'sum': round(value['sum'] + other['sum'], 3),
+            }
+        elif isinstance(value, dict):
+            result[key] = dict(Counter(value) + Counter(other))
+        else:
+            result[key] = value + other
+    return result
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """Замеряет каждый запрос: общее время, число и время SQL-запросов,
+    время сериализации и отрисовки, размер ответа и повторяющиеся
+    запросы. Отдаёт их в Server-Timing, в лог и в гистограммы."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            with metrics.track_queries():
+                response = self.get_response(request)
+            self.finish(response, metrics)
+        finally:
+            current.reset(token)
+        return self.observe(request, response, metrics)
+
+    async def __acall__(self, request):
+        """Под ASGI запросы к БД считаются в потоках пула
+        (см. api.asynchronous), куда передаётся контекст запроса."""
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = await self.get_response(request)
+            self.finish(response, metrics)
+        finally:
+            current.reset(token)
+        return self.observe(request, response, metrics)
+
+    @staticmethod
+    def finish(response, metrics):
+        if metrics.render_started is not None:
+            metrics.render_time = time.perf_counter() - metrics.render_started
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = metrics.server_timing()
+
+    def observe(self, request, response, metrics):
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, metrics, response.streaming_content
+            )
+        else:
+            self.record(request, response, metrics, len(response.content))
+        return response
+
+    def process_template_response(self, request, response):
+        metrics = current.get()
+        if metrics is not None and not response.is_rendered:
+            metrics.render_started = time.perf_counter()
+        return response
+
+    def stream(self, request, response, metrics, content):
+        size = 0
+        try:
+            with metrics.track_queries():
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.record(request, response, metrics, size)
+
+    def record(self, request, response, metrics, size):
+        match = request.resolver_match
+        name = match.view_name if match else 'unresolved'
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'url_name': name,
+            'status': response.status_code,
+            'total_ms': round(metrics.elapsed * 1000, 3),
+            'sql_count': metrics.sql_count,
+            'sql_ms': round(metrics.sql_time * 1000, 3),
+            'serializer_ms': round(metrics.serializer_time * 1000, 3),
+            'render_ms': round(metrics.render_time * 1000, 3),
+            'bytes': size,
+            'duplicates': metrics.duplicates(),
+        }
+        registry.observe(name, record)
+        logger.info(json.dumps(record, ensure_ascii=False))
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return JsonResponse(
+        registry.collect(), json_dumps_params={'ensure_ascii': False}
+    )
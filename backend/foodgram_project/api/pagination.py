@@ -0,0 +1,163 @@
+import base64
+import json
+from collections import OrderedDict, namedtuple
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+TimelineKey = namedtuple('TimelineKey', ('pub_date', 'pk'))
+
+
+class LimitPageNumberPagination(PageNumberPagination):
+    page_size_query_param = 'limit'
+
+
+class RecipePagination(LimitPageNumberPagination):
+    """Постраничная навигация по номеру страницы или, по запросу
+    ?pagination=cursor, по ключу (pub_date, id) без OFFSET и COUNT."""
+
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    ordering_query_param = api_settings.ORDERING_PARAM
+    invalid_cursor_message = 'Некорректный курсор.'
+    cursor_ordering_message = (
+        'Курсор задаёт порядок от новых рецептов к старым и не сочетается '
+        'с сортировкой, используйте постраничную навигацию.'
+    )
+
+    def use_cursor(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.use_cursor(request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        if request.query_params.get(self.ordering_query_param):
+            raise ValidationError(
+                {self.ordering_query_param: [self.cursor_ordering_message]}
+            )
+        self.request = request
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'true':
+            self.count = queryset.count()
+        page_size = self.get_page_size(request)
+        reverse, position = self.decode_cursor(request)
+        return self.set_page(
+            self.keyset(queryset, reverse, position, page_size + 1),
+            reverse, position, page_size,
+        )
+
+    def keyset(self, queryset, reverse, position, limit, id_field='pk'):
+        """Первые limit строк после позиции (pub_date, id) в порядке
+        ленты или, при reverse, перед ней в обратном порядке."""
+        if position is not None:
+            pub_date, pk = position
+            lookup = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'pub_date__{lookup}': pub_date})
+                | Q(pub_date=pub_date, **{f'{id_field}__{lookup}': pk})
+            )
+        if reverse:
+            ordering = ('pub_date', id_field)
+        else:
+            ordering = ('-pub_date', f'-{id_field}')
+        return list(queryset.order_by(*ordering)[:limit])
+
+    def set_page(self, results, reverse, position, page_size):
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.page = results
+        return results
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            pub_date = parse_datetime(data['d'])
+            pk = int(data['i'])
+            reverse = bool(data.get('r'))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, (pub_date, pk)
+
+    def encode_cursor(self, recipe, reverse):
+        data = {'d': recipe.pub_date.isoformat(), 'i': recipe.pk}
+        if reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(data).encode()
+        ).decode()
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.mode_query_param
+        )
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+
+class TimelinePagination(RecipePagination):
+    """Лента подписок, всегда по курсору. Принимает список пар
+    (queryset, поле id) и сливает их по ключу (pub_date, id);
+    страница состоит из TimelineKey, повторы ключей схлопываются."""
+
+    def paginate_queryset(self, sources, request, view=None):
+        self.cursor_mode = True
+        self.request = request
+        self.count = None
+        page_size = self.get_page_size(request)
+        reverse, position = self.decode_cursor(request)
+        keys = set()
+        for queryset, id_field in sources:
+            keys.update(
+                TimelineKey(*row) for row in self.keyset(
+                    queryset.values_list('pub_date', id_field),
+                    reverse, position, page_size + 1, id_field,
+                )
+            )
+        return self.set_page(
+            sorted(keys, reverse=not reverse)[:page_size + 1],
+            reverse, position, page_size,
+        )
@@ -0,0 +1,417 @@
+import struct
+import zlib
+from functools import lru_cache
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 50
+FONT_SIZE = 12
+LEADING = 18
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+SUBSET_TABLES = (
+    'cvt ', 'fpgm', 'glyf', 'head', 'hhea', 'hmtx', 'loca', 'maxp', 'prep',
+)
+COMPOSITE_WORDS = 0x0001
+COMPOSITE_SCALE = 0x0008
+COMPOSITE_MORE = 0x0020
+COMPOSITE_XY_SCALE = 0x0040
+COMPOSITE_TWO_BY_TWO = 0x0080
+CHECKSUM_MAGIC = 0xB1B0AFBA
+
+
+class TrueTypeFont:
+    """Минимальный разбор TrueType-шрифта для встраивания в PDF."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as font_file:
+            self.data = font_file.read()
+        self.name = ''.join(
+            char for char in path.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+            if char.isalnum() or char == '-'
+        ) or 'Font'
+        self.tables = self._read_tables()
+        head = self.tables['head']
+        self.units_per_em = self._unpack('>H', head + 18)
+        self.bbox = [
+            self._scale(value)
+            for value in struct.unpack_from('>4h', self.data, head + 36)
+        ]
+        hhea = self.tables['hhea']
+        self.ascent = self._scale(self._unpack('>h', hhea + 4))
+        self.descent = self._scale(self._unpack('>h', hhea + 6))
+        self.metrics_count = self._unpack('>H', hhea + 34)
+        self.cmap = self._read_cmap()
+        self.glyph_count = self._unpack('>H', self.tables['maxp'] + 4)
+        self.long_loca = self._unpack('>h', head + 50) == 1
+
+    def _unpack(self, fmt, offset):
+        return struct.unpack_from(fmt, self.data, offset)[0]
+
+    def _scale(self, value):
+        return int(value * 1000 / self.units_per_em)
+
+    def _read_tables(self):
+        tables = {}
+        self.lengths = {}
+        for index in range(self._unpack('>H', 4)):
+            tag, _, offset, length = struct.unpack_from(
+                '>4sIII', self.data, 12 + index * 16
+            )
+            tables[tag.decode('latin-1')] = offset
+            self.lengths[tag.decode('latin-1')] = length
+        return tables
+
+    def table(self, tag):
+        offset = self.tables[tag]
+        return self.data[offset:offset + self.lengths[tag]]
+
+    def _read_cmap(self):
+        cmap = self.tables['cmap']
+        subtables = {}
+        for index in range(self._unpack('>H', cmap + 2)):
+            platform, encoding, offset = struct.unpack_from(
+                '>HHI', self.data, cmap + 4 + index * 8
+            )
+            subtables[(platform, encoding)] = cmap + offset
+        for key in ((3, 10), (0, 4), (3, 1), (0, 3)):
+            offset = subtables.get(key)
+            if offset is None:
+                continue
+            subtable_format = self._unpack('>H', offset)
+            if subtable_format == 12:
+                return self._read_cmap_format12(offset)
+            if subtable_format == 4:
+                return self._read_cmap_format4(offset)
+        raise ValueError('Шрифт не содержит таблицу Unicode cmap.')
+
+    def _read_cmap_format4(self, offset):
+        segments = self._unpack('>H', offset + 6) // 2
+        ends = offset + 14
+        starts = ends + segments * 2 + 2
+        deltas = starts + segments * 2
+        range_offsets = deltas + segments * 2
+        cmap = {}
+        for segment in range(segments):
+            end = self._unpack('>H', ends + segment * 2)
+            start = self._unpack('>H', starts + segment * 2)
+            delta = self._unpack('>h', deltas + segment * 2)
+            range_offset_position = range_offsets + segment * 2
+            range_offset = self._unpack('>H', range_offset_position)
+            for code in range(start, end + 1):
+                if code == 0xFFFF:
+                    continue
+                if range_offset:
+                    glyph = self._unpack('>H', (
+                        range_offset_position + range_offset
+                        + (code - start) * 2
+                    ))
+                    if glyph:
+                        glyph = (glyph + delta) % 0x10000
+                else:
+                    glyph = (code + delta) % 0x10000
+                if glyph:
+                    cmap[code] = glyph
+        return cmap
+
+    def _read_cmap_format12(self, offset):
+        cmap = {}
+        for group in range(self._unpack('>I', offset + 12)):
+            start, end, glyph = struct.unpack_from(
+                '>III', self.data, offset + 16 + group * 12
+            )
+            for code in range(start, end + 1):
+                cmap[code] = glyph + code - start
+        return cmap
+
+    def glyph_data(self, glyph):
+        loca = self.tables['loca']
+        if self.long_loca:
+            start, end = struct.unpack_from('>II', self.data, loca + glyph * 4)
+        else:
+            start, end = (
+                offset * 2 for offset in
+                struct.unpack_from('>HH', self.data, loca + glyph * 2)
+            )
+        offset = self.tables['glyf']
+        return self.data[offset + start:offset + end]
+
+    @staticmethod
+    def components(data):
+        """Глифы, из которых собран составной глиф."""
+        if len(data) < 10 or struct.unpack_from('>h', data)[0] >= 0:
+            return
+        position = 10
+        while True:
+            flags, glyph = struct.unpack_from('>HH', data, position)
+            yield glyph
+            position += 4 + (4 if flags & COMPOSITE_WORDS else 2)
+            if flags & COMPOSITE_SCALE:
+                position += 2
+            elif flags & COMPOSITE_XY_SCALE:
+                position += 4
+            elif flags & COMPOSITE_TWO_BY_TWO:
+                position += 8
+            if not flags & COMPOSITE_MORE:
+                return
+
+    def subset(self, glyphs):
+        """Файл шрифта, в котором контуры есть только у нужных глифов
+        и их составляющих. Номера глифов не меняются, поэтому подходит
+        /CIDToGIDMap /Identity."""
+        keep = set()
+        pending = {0, *glyphs}
+        while pending:
+            glyph = pending.pop()
+            if glyph in keep or glyph >= self.glyph_count:
+                continue
+            keep.add(glyph)
+            pending.update(self.components(self.glyph_data(glyph)))
+        glyf = bytearray()
+        loca = []
+        for glyph in range(self.glyph_count):
+            loca.append(len(glyf))
+            if glyph in keep:
+                glyf += self.glyph_data(glyph)
+                glyf += bytes(-len(glyf) % 4)
+        loca.append(len(glyf))
+        head = bytearray(self.table('head'))
+        struct.pack_into('>I', head, 8, 0)
+        struct.pack_into('>h', head, 50, 1)
+        tables = {
+            tag: self.table(tag) for tag in SUBSET_TABLES
+            if tag in self.tables
+        }
+        tables.update(
+            head=bytes(head),
+            glyf=bytes(glyf),
+            loca=struct.pack(f'>{len(loca)}I', *loca),
+        )
+        return build_font_file(tables)
+
+    def width(self, glyph):
+        index = min(glyph, self.metrics_count - 1)
+        return self._scale(
+            self._unpack('>H', self.tables['hmtx'] + index * 4)
+        )
+
+
+def table_checksum(data):
+    data += bytes(-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def build_font_file(tables):
+    count = len(tables)
+    power = 1 << (count.bit_length() - 1)
+    directory = [struct.pack(
+        '>IHHHH', 0x00010000, count, power * 16,
+        power.bit_length() - 1, count * 16 - power * 16,
+    )]
+    body = []
+    offset = 12 + count * 16
+    for tag in sorted(tables):
+        data = tables[tag]
+        if tag == 'head':
+            head_offset = offset
+        directory.append(struct.pack(
+            '>4sIII', tag.encode('latin-1'), table_checksum(data),
+            offset, len(data),
+        ))
+        body.append(data + bytes(-len(data) % 4))
+        offset += len(body[-1])
+    font = bytearray(b''.join(directory + body))
+    struct.pack_into(
+        '>I', font, head_offset + 8,
+        (CHECKSUM_MAGIC - table_checksum(bytes(font))) & 0xFFFFFFFF,
+    )
+    return bytes(font)
+
+
+@lru_cache(maxsize=None)
+def load_font(path):
+    try:
+        return TrueTypeFont(path)
+    except (OSError, KeyError, ValueError, struct.error):
+        return None
+
+
+def _escape(text):
+    return (
+        text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    )
+
+
+class PDFStreamWriter:
+    """Потоковая запись PDF: страницы отдаются по мере заполнения,
+    шрифт и дерево страниц дописываются в конце файла."""
+
+    def __init__(self, lines, font_path, title=None):
+        self.lines = lines
+        self.title = title
+        self.font = load_font(font_path)
+        if self.font is None:
+            raise ValueError(f'Не удалось загрузить шрифт {font_path}.')
+        self.offsets = {}
+        self.position = 0
+        self.last_id = 0
+        self.used_glyphs = {}
+
+    def reserve(self):
+        self.last_id += 1
+        return self.last_id
+
+    def emit(self, object_id, body, stream=None):
+        self.offsets[object_id] = self.position
+        chunk = f'{object_id} 0 obj\n{body}\n'.encode('latin-1')
+        if stream is not None:
+            chunk += b'stream\n' + stream + b'\nendstream\n'
+        chunk += b'endobj\n'
+        self.position += len(chunk)
+        return chunk
+
+    def encode(self, text):
+        glyphs = []
+        for char in text:
+            glyph = self.font.cmap.get(ord(char), 0)
+            self.used_glyphs.setdefault(glyph, char)
+            glyphs.append(f'{glyph:04X}')
+        return f'<{"".join(glyphs)}>'
+
+    def page(self, lines, pages_id, font_id):
+        commands = [
+            'BT',
+            f'/F1 {FONT_SIZE} Tf',
+            f'{LEADING} TL',
+            f'{MARGIN} {PAGE_HEIGHT - MARGIN} Td',
+        ]
+        commands.extend(f'{self.encode(line)} Tj T*' for line in lines)
+        commands.append('ET')
+        content = zlib.compress('\n'.join(commands).encode('latin-1'))
+        content_id = self.reserve()
+        page_id = self.reserve()
+        chunk = self.emit(
+            content_id,
+            f'<< /Length {len(content)} /Filter /FlateDecode >>',
+            content,
+        )
+        chunk += self.emit(
+            page_id,
+            f'<< /Type /Page /Parent {pages_id} 0 R '
+            f'/MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 {font_id} 0 R >> >> '
+            f'/Contents {content_id} 0 R >>'
+        )
+        return page_id, chunk
+
+    def font_objects(self, font_id):
+        font = self.font
+        font_data = font.subset(self.used_glyphs)
+        compressed = zlib.compress(font_data)
+        cid_font_id = self.reserve()
+        descriptor_id = self.reserve()
+        font_file_id = self.reserve()
+        to_unicode_id = self.reserve()
+        widths = ' '.join(
+            f'{glyph} [{font.width(glyph)}]'
+            for glyph in sorted(self.used_glyphs)
+        )
+        yield self.emit(
+            font_id,
+            f'<< /Type /Font /Subtype /Type0 /BaseFont /{font.name} '
+            f'/Encoding /Identity-H /DescendantFonts [{cid_font_id} 0 R] '
+            f'/ToUnicode {to_unicode_id} 0 R >>'
+        )
+        yield self.emit(
+            cid_font_id,
+            f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{font.name} '
+            '/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) '
+            '/Supplement 0 >> '
+            f'/FontDescriptor {descriptor_id} 0 R /DW 1000 '
+            f'/W [{widths}] /CIDToGIDMap /Identity >>'
+        )
+        yield self.emit(
+            descriptor_id,
+            f'<< /Type /FontDescriptor /FontName /{font.name} /Flags 32 '
+            f'/FontBBox [{" ".join(map(str, font.bbox))}] /ItalicAngle 0 '
+            f'/Ascent {font.ascent} /Descent {font.descent} '
+            f'/CapHeight {font.ascent} /StemV 80 '
+            f'/FontFile2 {font_file_id} 0 R >>'
+        )
+        yield self.emit(
+            font_file_id,
+            f'<< /Length {len(compressed)} /Length1 {len(font_data)} '
+            '/Filter /FlateDecode >>',
+            compressed,
+        )
+        mapping = [
+            f'<{glyph:04X}> <{char.encode("utf-16-be").hex().upper()}>'
+            for glyph, char in sorted(self.used_glyphs.items())
+        ]
+        blocks = []
+        for start in range(0, len(mapping), 100):
+            block = mapping[start:start + 100]
+            blocks.append(
+                f'{len(block)} beginbfchar\n' + '\n'.join(block)
+                + '\nendbfchar'
+            )
+        cmap = '\n'.join((
+            '/CIDInit /ProcSet findresource begin',
+            '12 dict begin',
+            'begincmap',
+            '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) '
+            '/Supplement 0 >> def',
+            '/CMapName /Adobe-Identity-UCS def',
+            '/CMapType 2 def',
+            '1 begincodespacerange',
+            '<0000> <FFFF>',
+            'endcodespacerange',
+            *blocks,
+            'endcmap',
+            'CMapName currentdict /CMap defineresource pop',
+            'end',
+            'end',
+        )).encode('latin-1')
+        yield self.emit(
+            to_unicode_id, f'<< /Length {len(cmap)} >>', cmap
+        )
+
+    def __iter__(self):
+        catalog_id = self.reserve()
+        pages_id = self.reserve()
+        font_id = self.reserve()
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.position += len(header)
+        yield header
+        page_ids = []
+        batch = [self.title, ''] if self.title else []
+        for line in self.lines:
+            batch.append(line)
+            if len(batch) == LINES_PER_PAGE:
+                page_id, chunk = self.page(batch, pages_id, font_id)
+                page_ids.append(page_id)
+                batch = []
+                yield chunk
+        if batch or not page_ids:
+            page_id, chunk = self.page(batch, pages_id, font_id)
+            page_ids.append(page_id)
+            yield chunk
+        yield from self.font_objects(font_id)
+        kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+        yield self.emit(
+            pages_id,
+            f'<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>'
+        )
+        yield self.emit(
+            catalog_id, f'<< /Type /Catalog /Pages {pages_id} 0 R >>'
+        )
+        xref = [f'xref\n0 {self.last_id + 1}\n', '0000000000 65535 f \n']
+        xref.extend(
+            f'{self.offsets[object_id]:010d} 00000 n \n'
+            for object_id in range(1, self.last_id + 1)
+        )
+        xref.append(
+            f'trailer\n<< /Size {self.last_id + 1} '
+            f'/Root {catalog_id} 0 R >>\n'
+            f'startxref\n{self.position}\n%%EOF\n'
+        )
+        yield ''.join(xref).encode('latin-1')
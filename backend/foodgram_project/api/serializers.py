@@ -1,14 +1,28 @@
+import hashlib
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models, transaction
+from django.db.models import Prefetch
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
-from rest_framework.pagination import PageNumberPagination
 
+from recipes.images import reset_variants, schedule_variants
 from recipes.models import (FavoriteRecipes, Ingredient, Recipe,
-                            RecipeIngredient, ShoppingCart, Tag)
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag)
 from users.models import Subscription, User
 
+from .cache import tag_cache
+from .metrics import TimedSerializerMixin, measure_serializer
+from .sparse import SparseFieldsetMixin
+from .viewer import Viewer
+
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, SparseFieldsetMixin,
+                     serializers.ModelSerializer):
 
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
@@ -24,11 +38,8 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous or not request:
-            return False
-        return Subscription.objects.filter(
-            user=request.user, author=obj).exists()
+        viewer = Viewer.from_context(self.context)
+        return obj.id in viewer.subscribed_author_ids
 
 
 class UserSignupSerializer(UserCreateSerializer):
@@ -44,14 +55,25 @@ class UserSignupSerializer(UserCreateSerializer):
         )
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, SparseFieldsetMixin,
+                    serializers.ModelSerializer):
 
     class Meta:
         model = Tag
         fields = ('id', 'name', 'color', 'slug')
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+def get_tags_by_id(context):
+    if 'tags_by_id' not in context:
+        context['tags_by_id'] = tag_cache.get_or_set('by-id', lambda: {
+            tag['id']: dict(tag)
+            for tag in TagSerializer(Tag.objects.all(), many=True).data
+        })
+    return context['tags_by_id']
+
+
+class IngredientSerializer(TimedSerializerMixin, SparseFieldsetMixin,
+                           serializers.ModelSerializer):
 
     class Meta:
         model = Ingredient
@@ -75,7 +97,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 class AddIngredientToRecipeSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField()
-    amount = serializers.IntegerField()
+    amount = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = RecipeIngredient
@@ -106,56 +128,116 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         return RecipeListSerializer(instance, context={
-            'request': self.context.get('request')
+            'request': self.context.get('request'),
+            'viewer': self.context.get('viewer'),
         }).data
 
+    def validate_ingredients(self, ingredients):
+        if not ingredients:
+            raise serializers.ValidationError(
+                'Добавьте хотя бы один ингредиент.'
+            )
+        ids = [ingredient['id'] for ingredient in ingredients]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться.'
+            )
+        missing = set(ids) - Ingredient.objects.in_bulk(ids).keys()
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: '
+                f'{", ".join(map(str, sorted(missing)))}.'
+            )
+        return ingredients
+
+    def set_ingredients(self, recipe, ingredients):
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        old_amounts = {}
+        changed, deleted = [], []
+        for row in RecipeIngredient.objects.filter(recipe=recipe):
+            ingredient_id = row.ingredients_id
+            if ingredient_id not in amounts or ingredient_id in old_amounts:
+                deleted.append(row.pk)
+            elif row.amount != amounts[ingredient_id]:
+                changed.append(row)
+            old_amounts[ingredient_id] = (
+                old_amounts.get(ingredient_id, 0) + row.amount
+            )
+        for row in changed:
+            row.amount = amounts[row.ingredients_id]
+        RecipeIngredient.objects.filter(pk__in=deleted).delete()
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredients_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in old_amounts
+        )
+        if old_amounts:
+            ShoppingListItem.objects.change_recipe(
+                recipe, old_amounts, amounts
+            )
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         author = self.context.get('request').user
         recipe = Recipe.objects.create(author_id=author.id, **validated_data)
         recipe.tags.set(tags)
-        for ingredient in ingredients:
-            current_ingredient = Ingredient.objects.get(
-                id=ingredient.get('id')
-            )
-            RecipeIngredient.objects.create(
-                ingredients=current_ingredient,
-                recipe=recipe,
-                amount=ingredient.get('amount')
-            )
+        self.set_ingredients(recipe, ingredients)
+        schedule_variants(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        context = self.context['request']
-        ingredients = validated_data.pop('ingredients')
-        tags = context.data['tags']
-        recipe = instance
-        instance.name = validated_data.get('name')
-        instance.text = validated_data.get('text')
-        instance.cooking_time = validated_data.get('cooking_time')
-        instance.image = validated_data.get('image')
-        instance.save()
-        instance.tags.set(tags)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        ingredients = context.data['ingredients']
-        for ingredient in ingredients:
-            current_ingredient = Ingredient.objects.get(
-                id=ingredient.get('id')
-            )
-            RecipeIngredient.objects.create(
-                recipe=recipe,
-                ingredients=current_ingredient,
-                amount=ingredient.get('amount')
-            )
+        ingredients = validated_data.pop('ingredients', None)
+        if 'image' in validated_data:
+            reset_variants(instance)
+        instance = super().update(instance, validated_data)
+        if ingredients is not None:
+            self.set_ingredients(instance, ingredients)
+        if not instance.thumbnail:
+            schedule_variants(instance)
         return instance
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
-    tags = TagSerializer(many=True, read_only=True)
+class RecipeCardListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        recipes = list(data)
+        with measure_serializer():
+            return self.child.represent_many(recipes)
+
+
+class RecipeListSerializer(TimedSerializerMixin, SparseFieldsetMixin,
+                           serializers.ModelSerializer):
+    """Карточка рецепта. Независимая от пользователя часть кешируется
+    по id и времени изменения рецепта, флаги пользователя
+    накладываются поверх неё при каждом ответе."""
+
+    card_schema = 2
+    expandable_fields = {
+        'author': lambda: serializers.PrimaryKeyRelatedField(read_only=True),
+        'tags': lambda: serializers.SerializerMethodField('get_tag_ids'),
+        'ingredients': lambda: serializers.SerializerMethodField(
+            'get_ingredient_amounts'
+        ),
+    }
+
+    tags = serializers.SerializerMethodField()
     author = UserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    image = serializers.ImageField(read_only=True)
+    thumbnail = serializers.ImageField(read_only=True)
+    card_image = serializers.ImageField(read_only=True)
+    full_image = serializers.ImageField(read_only=True)
     is_favorited = serializers.SerializerMethodField(
         method_name='get_is_favorited'
     )
@@ -174,30 +256,159 @@ class RecipeListSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'thumbnail',
+            'card_image',
+            'full_image',
             'text',
             'cooking_time',
         )
+        list_serializer_class = RecipeCardListSerializer
+
+    @staticmethod
+    def setup_queryset(queryset, fields=None, collapsed=()):
+        """Подгружает только связи, нужные для полей fields."""
+        fields = RecipeListSerializer.Meta.fields if fields is None else fields
+        if 'author' in fields and 'author' not in collapsed:
+            queryset = queryset.select_related('author')
+        if 'tags' in fields:
+            queryset = queryset.prefetch_related('recipetag_set')
+        if 'ingredients' in fields:
+            ingredients = RecipeIngredient.objects.all()
+            if 'ingredients' not in collapsed:
+                ingredients = ingredients.select_related('ingredients')
+            queryset = queryset.prefetch_related(
+                Prefetch('recipe_ingredients', queryset=ingredients)
+            )
+        return queryset
+
+    def card_key(self, recipe_id, modified):
+        request = self.context.get('request')
+        base = request.build_absolute_uri('/') if request else ''
+        digest = hashlib.md5(base.encode()).hexdigest()[:8]
+        return (
+            f'recipe-card:{self.card_schema}:{recipe_id}:'
+            f'{modified.timestamp()}:{digest}'
+        )
+
+    def render_cards(self, recipe_ids, store):
+        """Сериализует рецепты по текущему набору полей. Полные карточки
+        сохраняются в кеш, усечённые — нет."""
+        keys, cards = {}, {}
+        recipes = self.setup_queryset(
+            Recipe.objects.filter(pk__in=recipe_ids),
+            self.fields,
+            self.collapsed_fields,
+        )
+        for recipe in recipes:
+            card = super().to_representation(recipe)
+            if store:
+                card['author']['is_subscribed'] = False
+                card['is_favorited'] = False
+                card['is_in_shopping_cart'] = False
+            keys[recipe.pk] = self.card_key(recipe.pk, recipe.modified)
+            cards[keys[recipe.pk]] = card
+        if store:
+            caches['cards'].set_many(
+                cards, settings.RECIPE_CARD_CACHE_TIMEOUT
+            )
+        return keys, cards
+
+    def represent_many(self, recipes):
+        fields = list(self.fields)
+        keys = {
+            recipe.pk: self.card_key(recipe.pk, recipe.modified)
+            for recipe in recipes
+        }
+        cards = {}
+        if not self.collapsed_fields:
+            cards = caches['cards'].get_many(keys.values())
+        missing = [pk for pk, key in keys.items() if key not in cards]
+        if missing:
+            rendered_keys, rendered = self.render_cards(
+                missing,
+                store=(
+                    not self.collapsed_fields
+                    and fields == list(self.Meta.fields)
+                ),
+            )
+            keys.update(rendered_keys)
+            cards.update(rendered)
+        viewer = Viewer.from_context(self.context)
+        representations = []
+        for recipe in recipes:
+            card = cards.get(keys[recipe.pk])
+            if card is None:
+                continue
+            data = {name: card[name] for name in fields}
+            if isinstance(data.get('author'), dict):
+                data['author'] = dict(
+                    card['author'],
+                    is_subscribed=card['author']['id'] in (
+                        viewer.subscribed_author_ids
+                    ),
+                )
+            if 'is_favorited' in data:
+                data['is_favorited'] = recipe.pk in viewer.favorite_recipe_ids
+            if 'is_in_shopping_cart' in data:
+                data['is_in_shopping_cart'] = (
+                    recipe.pk in viewer.cart_recipe_ids
+                )
+            representations.append(data)
+        return representations
+
+    def to_representation(self, instance):
+        representations = self.represent_many([instance])
+        if not representations:
+            return super().to_representation(instance)
+        return representations[0]
+
+    def get_tags(self, obj):
+        tags = get_tags_by_id(self.context)
+        return sorted(
+            (
+                tags[link.tags_id] for link in obj.recipetag_set.all()
+                if link.tags_id in tags
+            ),
+            key=itemgetter('name')
+        )
+
+    def get_tag_ids(self, obj):
+        return [link.tags_id for link in obj.recipetag_set.all()]
 
     def get_ingredients(self, obj):
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
-        return RecipeIngredientSerializer(ingredients, many=True).data
+        return RecipeIngredientSerializer(
+            obj.recipe_ingredients.all(), many=True
+        ).data
+
+    def get_ingredient_amounts(self, obj):
+        return [
+            {'id': row.ingredients_id, 'amount': row.amount}
+            for row in obj.recipe_ingredients.all()
+        ]
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous or not request:
-            return False
-        return FavoriteRecipes.objects.filter(
-            user=request.user, recipe=obj).exists()
+        viewer = Viewer.from_context(self.context)
+        return obj.id in viewer.favorite_recipe_ids
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous or not request:
-            return False
-        return ShoppingCart.objects.filter(
-            user=request.user, recipe_id=obj).exists()
+        viewer = Viewer.from_context(self.context)
+        return obj.id in viewer.cart_recipe_ids
+
+
+class ThumbnailField(serializers.ImageField):
+    """Миниатюра рецепта, пока её нет — исходная картинка."""
 
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
 
-class ShortenedRecipeSerializer(serializers.ModelSerializer):
+    def get_attribute(self, instance):
+        return instance.thumbnail or instance.image
+
+
+class ShortenedRecipeSerializer(TimedSerializerMixin, SparseFieldsetMixin,
+                                serializers.ModelSerializer):
+    image = ThumbnailField()
 
     class Meta:
         model = Recipe
@@ -228,10 +439,15 @@ class FavoriteRecipesSerializer(serializers.ModelSerializer):
         }).data
 
 
-class UserSubscrptionSerializer(serializers.ModelSerializer):
+class UserSubscrptionSerializer(TimedSerializerMixin, SparseFieldsetMixin,
+                                serializers.ModelSerializer):
+    expandable_fields = {
+        'recipes': lambda: serializers.SerializerMethodField('get_recipe_ids'),
+    }
+
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -247,24 +463,36 @@ class UserSubscrptionSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous or not request:
-            return False
-        return Subscription.objects.filter(
-            user=request.user, author=obj).exists()
+        viewer = Viewer.from_context(self.context)
+        return obj.id in viewer.subscribed_author_ids
+
+    @staticmethod
+    def get_recipes_limit(request):
+        try:
+            limit = int(request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+        return max(limit, 0)
+
+    def latest_recipes(self, obj):
+        if hasattr(obj, 'latest_recipes'):
+            return obj.latest_recipes
+        recipes = obj.recipes.all()
+        limit = self.get_recipes_limit(self.context['request'])
+        if limit is not None:
+            recipes = recipes[:limit]
+        return recipes
 
     def get_recipes(self, obj):
         request = self.context.get('request')
         if request.user.is_anonymous or not request:
             return False
-        recipes = Recipe.objects.filter(author=obj)
-        paginator = PageNumberPagination()
-        paginator.page_size_query_param = 'limit'
         return ShortenedRecipeSerializer(
-            recipes, many=True, context={'request': request}).data
+            self.latest_recipes(obj), many=True, context={'request': request}
+        ).data
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+    def get_recipe_ids(self, obj):
+        return [recipe.pk for recipe in self.latest_recipes(obj)]
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -0,0 +1,98 @@
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+EXPAND_PARAM = 'expand'
+
+
+def _names(request, param):
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    return frozenset(name.strip() for name in value.split(',')) - {''}
+
+
+class Shape:
+    """Форма ответа, запрошенная через ?fields=, ?omit= и ?expand=.
+    Без ?expand= все вложенные объекты раскрыты, как раньше."""
+
+    def __init__(self, fields=None, omit=None, expand=None):
+        self.fields = fields or None
+        self.omit = omit or frozenset()
+        self.expand = expand
+
+    @classmethod
+    def for_request(cls, request):
+        shape = getattr(request, 'sparse_shape', None)
+        if shape is None:
+            if request is None or request.method not in SAFE_METHODS:
+                shape = cls()
+            else:
+                shape = cls(
+                    _names(request, FIELDS_PARAM),
+                    _names(request, OMIT_PARAM),
+                    _names(request, EXPAND_PARAM),
+                )
+            if request is not None:
+                request.sparse_shape = shape
+        return shape
+
+    @property
+    def names(self):
+        return (self.fields or frozenset()) | self.omit | (
+            self.expand or frozenset()
+        )
+
+    def includes(self, name):
+        return (
+            (self.fields is None or name in self.fields)
+            and name not in self.omit
+        )
+
+    def collapses(self, name):
+        return self.expand is not None and name not in self.expand
+
+    def is_default(self):
+        return self.fields is None and not self.omit and self.expand is None
+
+
+class SparseFieldsetMixin:
+    """Оставляет в корневом сериализаторе ответа только запрошенные поля.
+    Исключённые поля не вычисляются; поля из expandable_fields
+    при ?expand= без их имени сворачиваются до идентификаторов."""
+
+    expandable_fields = {}
+
+    @property
+    def shape(self):
+        parent = self.parent
+        is_root = parent is None or (
+            isinstance(parent, serializers.ListSerializer)
+            and parent.parent is None
+        )
+        if not is_root or 'view' not in self.context:
+            return Shape()
+        return Shape.for_request(self.context.get('request'))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        shape = self.shape
+        self.collapsed_fields = set()
+        if shape.is_default():
+            return fields
+        unknown = shape.names - set(fields)
+        if unknown:
+            raise serializers.ValidationError({
+                FIELDS_PARAM: [
+                    f'Неизвестные поля: {", ".join(sorted(unknown))}. '
+                    f'Доступны: {", ".join(fields)}.'
+                ]
+            })
+        for name in list(fields):
+            if not shape.includes(name):
+                del fields[name]
+            elif name in self.expandable_fields and shape.collapses(name):
+                fields[name] = self.expandable_fields[name]()
+                self.collapsed_fields.add(name)
+        return fields
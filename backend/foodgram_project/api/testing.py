@@ -0,0 +1,198 @@
+"""Общие средства тестов и check_nplusone: изолированный кеш, набор
+данных, который растёт по запросу, и проверка того, что число запросов
+к БД не растёт вместе с ним."""
+
+import os
+import traceback
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.cache import caches
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.metrics import fingerprint
+from recipes.models import (FavoriteRecipes, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, ShoppingCart, Tag)
+from users.models import Subscription, User
+
+PAGE = 'limit=100'
+
+
+def isolated_caches(prefix):
+    """Настройка CACHES, в которой у каждого алиаса свой кеш
+    в памяти процесса."""
+    return {
+        alias: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': f'{prefix}-{alias}',
+        }
+        for alias in settings.CACHES
+    }
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+class QueryLog:
+    """Отпечатки SQL-запросов и место в коде проекта, откуда они пришли."""
+
+    skip = (
+        __file__,
+        os.path.join('api', 'metrics.py'),
+        os.path.join('api', 'tests.py'),
+    )
+
+    def __init__(self):
+        self.counts = Counter()
+        self.origins = defaultdict(Counter)
+
+    def __call__(self, execute, sql, params, many, context):
+        key = fingerprint(sql)
+        self.counts[key] += 1
+        self.origins[key][self.origin()] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def origin(self):
+        for frame in reversed(traceback.extract_stack()[:-2]):
+            if (
+                frame.filename.startswith(settings.BASE_DIR)
+                and not frame.filename.endswith(self.skip)
+            ):
+                path = os.path.relpath(frame.filename, settings.BASE_DIR)
+                return f'{path}:{frame.lineno} в {frame.name}'
+        return 'вне кода проекта'
+
+    def growth(self, before):
+        """Строки отчёта о запросах, которых стало больше, чем
+        в before, с местами, откуда они пришли."""
+        lines = []
+        for key, count in self.counts.items():
+            grown = count - before.counts.get(key, 0)
+            if grown <= 0:
+                continue
+            lines.append(f'  +{grown} × {key[:200]}')
+            for origin, hits in self.origins[key].most_common(3):
+                lines.append(f'      {hits} × {origin}')
+        return lines
+
+
+def measure(client, url):
+    """Запрашивает url с пустым кешем, чтобы закешированные карточки
+    не скрыли запросы на каждую строку. Возвращает ответ и QueryLog."""
+    clear_caches()
+    log = QueryLog()
+    with connections['default'].execute_wrapper(log):
+        response = client.get(url)
+    return response, log
+
+
+def endpoints():
+    """Эндпоинты API и списки админки, которые проверяются на N+1:
+    имя → (клиент 'api' или 'site', url)."""
+    recipes = reverse('api:recipes-list')
+    subscriptions = reverse('api:subscriptions')
+    urls = {
+        'recipes': ('api', f'{recipes}?{PAGE}'),
+        'recipes_favorited': ('api', f'{recipes}?is_favorited=1&{PAGE}'),
+        'recipes_sparse': ('api', f'{recipes}?expand=&omit=text&{PAGE}'),
+        'subscriptions': ('api', f'{subscriptions}?{PAGE}'),
+        'subscriptions_limited': (
+            'api', f'{subscriptions}?recipes_limit=2&{PAGE}'
+        ),
+        'users': ('api', f"{reverse('api:user-list')}?{PAGE}"),
+    }
+    for model in admin.site._registry:
+        opts = model._meta
+        url_name = f'admin:{opts.app_label}_{opts.model_name}_changelist'
+        urls[f'admin:{opts.model_name}'] = ('site', reverse(url_name))
+    return urls
+
+
+def clients_for(viewer):
+    api = APIClient()
+    api.force_authenticate(viewer)
+    site = Client()
+    site.force_login(viewer)
+    return {'api': api, 'site': site}
+
+
+class GrowingDataset:
+    """Авторы с рецептами, тегами и ингредиентами; зритель подписан на
+    каждого автора, а все рецепты у него в избранном и в корзине."""
+
+    def __init__(self, viewer, prefix):
+        self.viewer = viewer
+        self.prefix = prefix
+        self.size = 0
+        self.tags = [
+            Tag.objects.create(
+                name=f'{prefix}-{index}',
+                color=f'#ABCDE{index}',
+                slug=f'{prefix}-{index}',
+            )
+            for index in range(2)
+        ]
+
+    def grow(self, size):
+        """Доводит число авторов до size, у каждого по два рецепта."""
+        for index in range(self.size, size):
+            author = User.objects.create_user(
+                username=f'{self.prefix}-{index}',
+                email=f'{self.prefix}-{index}@foodgram.local',
+                password=None,
+            )
+            Subscription.objects.create(user=self.viewer, author=author)
+            for number in range(2):
+                recipe = Recipe.objects.create(
+                    author=author,
+                    name=f'{self.prefix} {index}-{number}',
+                    image=f'recipes/{self.prefix}.png',
+                    text=self.prefix,
+                    cooking_time=10,
+                )
+                ingredient = Ingredient.objects.create(
+                    name=f'{self.prefix} {index}-{number}',
+                    measurement_unit='г',
+                )
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredients=ingredient, amount=10
+                )
+                RecipeTag.objects.bulk_create(
+                    RecipeTag(recipe=recipe, tags=tag) for tag in self.tags
+                )
+                FavoriteRecipes.objects.create(user=self.viewer, recipe=recipe)
+                ShoppingCart.objects.create(user=self.viewer, recipe=recipe)
+        self.size = max(self.size, size)
+
+
+class ConstantQueriesMixin:
+    """assert_constant_queries для TestCase: запрос к url на двух объёмах
+    данных не должен давать больше запросов к БД на большем."""
+
+    small = 2
+    large = 6
+
+    def assert_constant_queries(self, client, url, dataset):
+        dataset.grow(self.small)
+        response, before = measure(client, url)
+        self.assertEqual(response.status_code, 200, url)
+        dataset.grow(self.large)
+        response, after = measure(client, url)
+        self.assertEqual(response.status_code, 200, url)
+        if after.total > before.total:
+            self.fail('\n'.join((
+                f'{url}: {before.total} запросов при {self.small} авторах, '
+                f'{after.total} при {self.large}',
+                *after.growth(before),
+            )))
+        return response
@@ -0,0 +1,578 @@
+import re
+import zlib
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            ShoppingListItem, Tag, TimelineEntry)
+from users.models import Subscription, User
+
+from .metrics import WORKER_KEY, Registry
+from .testing import (ConstantQueriesMixin, GrowingDataset, clear_caches,
+                      clients_for, endpoints, isolated_caches)
+
+ISOLATED_CACHE = isolated_caches('api-tests')
+
+
+@override_settings(CACHES=ISOLATED_CACHE, METRICS_ENABLED=False)
+class RecipeListQueriesTest(ConstantQueriesMixin, TestCase):
+    """Число запросов списка рецептов не зависит от числа рецептов,
+    тегов, ингредиентов и отметок зрителя."""
+
+    url = reverse('api:recipes-list') + '?limit=100'
+
+    def setUp(self):
+        self.viewer = User.objects.create_user(
+            username='viewer', email='viewer@foodgram.local', password=None
+        )
+        self.dataset = GrowingDataset(self.viewer, 'recipes')
+
+    def test_anonymous(self):
+        response = self.assert_constant_queries(
+            APIClient(), self.url, self.dataset
+        )
+        self.assertEqual(len(response.data['results']), 12)
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.viewer)
+        response = self.assert_constant_queries(client, self.url, self.dataset)
+        self.assertEqual(len(response.data['results']), 12)
+
+
+@override_settings(CACHES=ISOLATED_CACHE, METRICS_ENABLED=False)
+class NPlusOneTest(ConstantQueriesMixin, TestCase):
+    """Эндпоинты API и списки админки без запросов на каждую строку."""
+
+    def test_endpoints(self):
+        viewer = User.objects.create_superuser(
+            username='nplusone-viewer',
+            email='nplusone-viewer@foodgram.local',
+            password=None,
+        )
+        clients = clients_for(viewer)
+        for name, (client, url) in endpoints().items():
+            with self.subTest(name), transaction.atomic():
+                self.assert_constant_queries(
+                    clients[client], url,
+                    GrowingDataset(viewer, name.replace(':', '-')),
+                )
+                transaction.set_rollback(True)
+
+
+def create_user(name):
+    return User.objects.create_user(
+        username=name, email=f'{name}@foodgram.local', password=None
+    )
+
+
+def create_recipe(author, name):
+    return Recipe.objects.create(
+        author=author, name=name, image='recipes/test.png', text=name,
+        cooking_time=10,
+    )
+
+
+def walk(client, url, link='next'):
+    """id рецептов со всех страниц, по которым проходят ссылки link."""
+    ids = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200, response.data
+        ids.append([recipe['id'] for recipe in response.data['results']])
+        url = response.data[link]
+    return ids
+
+
+@override_settings(CACHES=ISOLATED_CACHE, METRICS_ENABLED=False)
+class RecipePaginationTest(TestCase):
+    """Навигация по курсору проходит ленту без повторов и пропусков,
+    даже когда у рецептов совпадает pub_date."""
+
+    url = reverse('api:recipes-list')
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('cook')
+        recipes = [
+            create_recipe(author, f'recipe {index}') for index in range(23)
+        ]
+        moment = recipes[0].pub_date
+        for index, recipe in enumerate(recipes):
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=moment - timedelta(minutes=index // 5)
+            )
+        cls.ids = list(Recipe.objects.order_by(
+            '-pub_date', '-pk'
+        ).values_list('pk', flat=True))
+
+    def test_walk_forward_and_back(self):
+        client = APIClient()
+        pages = walk(client, f'{self.url}?pagination=cursor&limit=4')
+        self.assertTrue(all(len(page) == 4 for page in pages[:-1]))
+        walked = [pk for page in pages for pk in page]
+        self.assertEqual(walked, self.ids)
+        last = client.get(f'{self.url}?pagination=cursor&limit=4')
+        while last.data['next']:
+            last = client.get(last.data['next'])
+        back = walk(client, last.data['previous'], 'previous')
+        self.assertEqual(
+            [pk for page in reversed(back) for pk in page],
+            self.ids[:-len(pages[-1])],
+        )
+
+    def test_cursor_rejects_ordering(self):
+        response = APIClient().get(
+            self.url, {'pagination': 'cursor', 'ordering': '-favorites_count'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.data)
+        response = APIClient().get(
+            self.url, {'pagination': 'cursor', 'limit': 100}
+        )
+        self.assertEqual(len(response.data['results']), len(self.ids))
+
+
+@override_settings(
+    CACHES=ISOLATED_CACHE, METRICS_ENABLED=False, TIMELINE_FANOUT_LIMIT=1
+)
+class TimelineTest(TestCase):
+    """Рецепты авторов с подписчиками сверх TIMELINE_FANOUT_LIMIT
+    читаются при запросе и попадают в ленту наравне с разосланными."""
+
+    url = reverse('api:recipes-timeline')
+
+    def setUp(self):
+        self.viewer = create_user('viewer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        self.popular = create_user('popular')
+        self.niche = create_user('niche')
+        self.fan = create_user('fan')
+
+    def subscribe(self, user, author):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(reverse('api:subscribe', args=(author.id,)))
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def publish(self, author, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_recipe(author, name).pk
+
+    def test_pulled_author_is_in_timeline(self):
+        older = self.publish(self.popular, 'popular 0')
+        self.subscribe(self.viewer, self.popular)
+        self.subscribe(self.fan, self.popular)
+        self.subscribe(self.viewer, self.niche)
+        niche = self.publish(self.niche, 'niche 0')
+        newer = self.publish(self.popular, 'popular 1')
+        self.assertFalse(
+            TimelineEntry.objects.filter(recipe=newer).exists()
+        )
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.viewer, recipe=niche
+        ).exists())
+        pages = walk(self.client, f'{self.url}?limit=2')
+        self.assertEqual(
+            [pk for page in pages for pk in page], [newer, niche, older]
+        )
+
+
+@override_settings(CACHES=ISOLATED_CACHE, METRICS_ENABLED=False)
+class SubscriptionsTest(TestCase):
+    """recipes_limit оставляет у каждого автора последние рецепты,
+    recipes_count считает все."""
+
+    def test_recipes_limit(self):
+        viewer = create_user('viewer')
+        authors = {}
+        with self.captureOnCommitCallbacks(execute=True):
+            for index, count in enumerate((5, 1, 0)):
+                author = create_user(f'author-{index}')
+                Subscription.objects.create(user=viewer, author=author)
+                authors[author] = [
+                    create_recipe(author, f'{index}-{number}')
+                    for number in range(count)
+                ]
+        latest = {}
+        for author, recipes in authors.items():
+            for recipe in recipes[:2]:
+                Recipe.objects.filter(pk=recipe.pk).update(
+                    pub_date=recipes[-1].pub_date
+                )
+            latest[author.id] = (len(recipes), list(Recipe.objects.filter(
+                author=author
+            ).order_by('-pub_date', '-id').values_list('id', flat=True)))
+        client = APIClient()
+        client.force_authenticate(viewer)
+        for limit in (0, 1, 3, 10):
+            response = client.get(
+                reverse('api:subscriptions'), {'recipes_limit': limit}
+            )
+            self.assertEqual(response.status_code, 200)
+            results = {
+                author['id']: (
+                    author['recipes_count'],
+                    [recipe['id'] for recipe in author['recipes']],
+                )
+                for author in response.data['results']
+            }
+            self.assertEqual(results, {
+                author_id: (count, ids[:limit])
+                for author_id, (count, ids) in latest.items()
+            })
+
+
+@override_settings(CACHES=ISOLATED_CACHE, METRICS_ENABLED=False)
+class ConditionalGetTest(TestCase):
+    """Рецепт с актуальным If-None-Match отдаётся ответом 304, а запись
+    в рецепт, его тег или автора меняет ETag."""
+
+    def setUp(self):
+        self.author = create_user('cook')
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        self.recipe = create_recipe(self.author, 'Блины')
+        RecipeTag.objects.create(recipe=self.recipe, tags=self.tag)
+        self.client = APIClient()
+        self.urls = (
+            reverse('api:recipes-detail', args=(self.recipe.id,)),
+            reverse('api:recipes-list'),
+        )
+
+    def etags(self):
+        etags = []
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response['ETag'], etag)
+            self.assertFalse(response.content)
+            etags.append(etag)
+        return etags
+
+    def assert_write_changes_etags(self, write):
+        before = self.etags()
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        after = self.etags()
+        for url, old, new in zip(self.urls, before, after):
+            self.assertNotEqual(old, new, url)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=old)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_recipe_write(self):
+        def write():
+            self.recipe.cooking_time = 20
+            self.recipe.save()
+        self.assert_write_changes_etags(write)
+
+    def test_tag_write(self):
+        def write():
+            self.tag.name = 'Завтраки'
+            self.tag.save()
+        self.assert_write_changes_etags(write)
+
+    def test_author_write(self):
+        def write():
+            self.author.first_name = 'Повар'
+            self.author.save()
+        self.assert_write_changes_etags(write)
+
+
+@override_settings(
+    CACHES=ISOLATED_CACHE, METRICS_WORKER_SLOTS=2, METRICS_WORKER_TIMEOUT=30
+)
+class MetricsRegistryTest(TestCase):
+    """Воркеры пишут снимки в свои слоты, у которых есть срок жизни,
+    и эндпоинт метрик складывает все живые слоты."""
+
+    def setUp(self):
+        clear_caches()
+
+    @staticmethod
+    def registry(count):
+        registry = Registry()
+        registry.snapshot = lambda: {'recipes': {'count': count}}
+        return registry
+
+    def test_workers_share_slots(self):
+        first, second, third = (self.registry(count) for count in (1, 2, 4))
+        first.flush(first.snapshot())
+        second.flush(second.snapshot())
+        self.assertEqual(first.collect(), {'recipes': {'count': 3}})
+        with self.assertLogs('foodgram.metrics', 'WARNING'):
+            third.flush(third.snapshot())
+        self.assertIsNone(third.slot)
+        cache.delete(WORKER_KEY.format(first.slot))
+        third.flush(third.snapshot())
+        self.assertEqual(second.collect(), {'recipes': {'count': 6}})
+        with self.assertLogs('foodgram.metrics', 'WARNING'):
+            first.flush(first.snapshot())
+        self.assertIsNone(first.slot)
+
+    def test_slot_expires(self):
+        registry = self.registry(1)
+        with patch.object(cache, 'add', wraps=cache.add) as add:
+            registry.flush(registry.snapshot())
+        self.assertEqual(add.call_args.args[2], 30)
+
+
+@override_settings(CACHES=ISOLATED_CACHE, METRICS_ENABLED=False)
+class RecipeFilterPlansTest(TestCase):
+    """Все комбинации фильтров списка рецептов читают данные по индексам:
+    explain_recipe_filters завершается с ошибкой на полном просмотре."""
+
+    def test_filters_use_indexes(self):
+        call_command('explain_recipe_filters', seed=300, stdout=StringIO())
+
+
+@override_settings(CACHES=ISOLATED_CACHE, METRICS_ENABLED=False)
+class ShoppingListTest(TestCase):
+    """Строки ShoppingListItem, которые поддерживают apply_delta
+    и change_recipe, совпадают с пересчётом из корзин."""
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            username='cook', email='cook@foodgram.local', password=None
+        )
+        self.buyers = [
+            User.objects.create_user(
+                username=f'buyer-{index}',
+                email=f'buyer-{index}@foodgram.local',
+                password=None,
+            )
+            for index in range(3)
+        ]
+        self.flour, self.milk, self.eggs = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Мука', 'Молоко', 'Яйца')
+        )
+        self.pancakes = self.create_recipe(
+            'Блины', {self.flour: 200, self.milk: 500}
+        )
+        self.pie = self.create_recipe(
+            'Пирог', {self.flour: 300, self.eggs: 2}
+        )
+
+    def create_recipe(self, name, amounts):
+        recipe = Recipe.objects.create(
+            author=self.author, name=name, image='recipes/test.png',
+            text=name, cooking_time=10,
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredients=ingredient,
+                             amount=amount)
+            for ingredient, amount in amounts.items()
+        )
+        return recipe
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def cart(self, user, recipe, method='post'):
+        response = getattr(self.client_for(user), method)(
+            reverse('api:shopping_cart', args=(recipe.id,))
+        )
+        self.assertIn(response.status_code, (201, 204))
+
+    def assert_items_match_carts(self, expected):
+        stored = sorted(ShoppingListItem.objects.values_list(
+            'user', 'ingredient', 'amount'
+        ))
+        self.assertEqual(
+            stored, list(ShoppingListItem.objects.expected_totals())
+        )
+        self.assertEqual(stored, sorted(
+            (user.id, ingredient.id, amount)
+            for user, ingredient, amount in expected
+        ))
+        call_command('rebuild_shopping_lists', check=True, stdout=StringIO())
+
+    def test_add_and_remove_recipe(self):
+        first, second, _ = self.buyers
+        self.cart(first, self.pancakes)
+        self.cart(first, self.pie)
+        self.cart(second, self.pie)
+        self.assert_items_match_carts((
+            (first, self.flour, 500), (first, self.milk, 500),
+            (first, self.eggs, 2),
+            (second, self.flour, 300), (second, self.eggs, 2),
+        ))
+        self.cart(first, self.pie, 'delete')
+        self.assert_items_match_carts((
+            (first, self.flour, 200), (first, self.milk, 500),
+            (second, self.flour, 300), (second, self.eggs, 2),
+        ))
+
+    def test_change_carted_recipe(self):
+        first, second, third = self.buyers
+        for buyer in (first, second):
+            self.cart(buyer, self.pancakes)
+        self.cart(first, self.pie)
+        response = self.client_for(self.author).patch(
+            reverse('api:recipes-detail', args=(self.pancakes.id,)),
+            {'ingredients': [
+                {'id': self.flour.id, 'amount': 250},
+                {'id': self.eggs.id, 'amount': 3},
+            ]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assert_items_match_carts((
+            (first, self.flour, 550), (first, self.eggs, 5),
+            (second, self.flour, 250), (second, self.eggs, 3),
+        ))
+
+    def test_delete_carted_recipe(self):
+        first, second, _ = self.buyers
+        for buyer in (first, second):
+            self.cart(buyer, self.pancakes)
+        self.cart(first, self.pie)
+        self.pie.delete()
+        self.assert_items_match_carts((
+            (first, self.flour, 200), (first, self.milk, 500),
+            (second, self.flour, 200), (second, self.milk, 500),
+        ))
+        self.pancakes.delete()
+        self.assert_items_match_carts(())
+
+    def test_apply_delta_batches(self):
+        for buyer in self.buyers:
+            self.cart(buyer, self.pancakes)
+        with patch.object(ShoppingListItem.objects, 'batch_size', 2):
+            ShoppingListItem.objects.change_recipe(
+                self.pancakes,
+                {self.flour.id: 200, self.milk.id: 500},
+                {self.flour.id: 100},
+            )
+        self.assertEqual(
+            list(ShoppingListItem.objects.values_list(
+                'user', 'ingredient', 'amount'
+            ).order_by('user_id')),
+            [(buyer.id, self.flour.id, 100) for buyer in self.buyers],
+        )
+
+
+def pdf_objects(content):
+    """Объекты PDF по таблице xref: id → (словарь, поток или None).
+    Проверяет, что startxref и каждое смещение в xref указывают
+    на начало своего объекта."""
+    startxref = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', content)[1])
+    xref = content[startxref:].split(b'trailer', 1)[0].splitlines()
+    assert xref[0] == b'xref', xref[0]
+    first, count = map(int, xref[1].split())
+    objects = {}
+    for object_id, entry in enumerate(xref[2:2 + count], first):
+        offset, _, kind = entry.split()
+        if kind != b'n':
+            continue
+        header = f'{object_id} 0 obj\n'.encode()
+        start = int(offset)
+        assert content.startswith(header, start), (object_id, start)
+        body_start = start + len(header)
+        body_end = content.index(b'\n', body_start)
+        body = content[body_start:body_end]
+        stream = None
+        if content.startswith(b'stream\n', body_end + 1):
+            length = int(re.search(rb'/Length (\d+)', body)[1])
+            stream_start = body_end + 1 + len(b'stream\n')
+            stream = content[stream_start:stream_start + length]
+            assert content.startswith(
+                b'\nendstream\nendobj\n', stream_start + length
+            ), object_id
+        objects[object_id] = (body, stream)
+    return objects
+
+
+@override_settings(CACHES=ISOLATED_CACHE, METRICS_ENABLED=False)
+class ShoppingListExportTest(TestCase):
+    """PDF со списком покупок встраивает только нужные глифы шрифта,
+    а без шрифта выгрузка отдаётся текстом."""
+
+    url = reverse('api:download_shopping_list')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@foodgram.local', password=None
+        )
+        ShoppingListItem.objects.create(
+            user=cls.user,
+            ingredient=Ingredient.objects.create(
+                name='Мука', measurement_unit='г'
+            ),
+            amount=500,
+        )
+
+    def download(self, export_format):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(self.url, {'format': export_format})
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_pdf_embeds_font_subset(self):
+        response, content = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertLess(len(content), 100 * 1024)
+
+    def test_pdf_structure_and_text_round_trip(self):
+        for index in range(60):
+            ShoppingListItem.objects.create(
+                user=self.user,
+                ingredient=Ingredient.objects.create(
+                    name=f'Перец (молотый) №{index}', measurement_unit='щепоть'
+                ),
+                amount=index + 1,
+            )
+        _, content = self.download('pdf')
+        objects = pdf_objects(content)
+        font = next(
+            body for body, _ in objects.values() if b'/Type0' in body
+        )
+        to_unicode = int(re.search(rb'/ToUnicode (\d+) 0 R', font)[1])
+        glyphs = {
+            glyph: bytes.fromhex(text.decode()).decode('utf-16-be')
+            for glyph, text in re.findall(
+                rb'<([0-9A-F]{4})> <([0-9A-F]+)>', objects[to_unicode][1]
+            )
+        }
+        pages = [
+            zlib.decompress(stream) for body, stream in objects.values()
+            if stream is not None and b'/FlateDecode' in body
+            and b'/Length1' not in body
+        ]
+        lines = [
+            ''.join(glyphs[line[start:start + 4]]
+                    for start in range(0, len(line), 4))
+            for page in pages
+            for line in re.findall(rb'<([0-9A-F]*)> Tj', page)
+        ]
+        self.assertGreater(len(pages), 1)
+        _, text = self.download('txt')
+        self.assertEqual(
+            lines, ['Список покупок', '', *text.decode().splitlines()]
+        )
+
+    @override_settings(SHOPPING_LIST_FONT='/nonexistent/font.ttf')
+    def test_pdf_without_font_falls_back_to_text(self):
+        response, content = self.download('pdf')
+        self.assertEqual(
+            response['Content-Type'], 'text/plain; charset=utf-8'
+        )
+        self.assertEqual(content.decode(), 'Мука - 500 г\n')
@@ -1,9 +1,11 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import (FavoriteRecipesView, IngredientViewSet, RecipeViewSet,
-                    ShoppingCartView, SubscriptionView, TagViewSet,
-                    UserSubscriptionsView, download_shopping_list)
+from .asynchronous import asynchronous
+from .metrics import metrics_view
+from .views import (DownloadShoppingListView, FavoriteRecipesView,
+                    IngredientViewSet, RecipeViewSet, ShoppingCartView,
+                    SubscriptionView, TagViewSet, UserSubscriptionsView)
 
 app_name = 'api'
 
@@ -14,21 +16,23 @@ router.register('ingredients', IngredientViewSet, basename='ingredients')
 router.register('tags', TagViewSet, basename='tags')
 
 urlpatterns = (
-    path(
-        'users/subscriptions/',
-        UserSubscriptionsView.as_view(),
-        name='subscriptions'
-    ),
+    *asynchronous([
+        path(
+            'users/subscriptions/',
+            UserSubscriptionsView.as_view(),
+            name='subscriptions'
+        ),
+        path(
+            'recipes/download_shopping_cart/',
+            DownloadShoppingListView.as_view(),
+            name='download_shopping_list'
+        ),
+    ]),
     path(
         'users/<int:id>/subscribe/',
         SubscriptionView.as_view(),
         name='subscribe'
     ),
-    path(
-        'recipes/download_shopping_cart/',
-        download_shopping_list,
-        name='download_shopping_list'
-    ),
     path(
         'recipes/<int:id>/shopping_cart/',
         ShoppingCartView.as_view(),
@@ -39,7 +43,8 @@ urlpatterns = (
         FavoriteRecipesView.as_view(),
         name='favorite'
     ),
+    path('metrics/', metrics_view, name='metrics'),
     path('auth/', include('djoser.urls.authtoken')),
     path('', include('djoser.urls')),
-    path('', include(router.urls)),
+    path('', include(asynchronous(router.urls))),
 )
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.utils.functional import cached_property
+
+from recipes.models import FavoriteRecipes, ShoppingCart
+from recipes.versioning import bump_version, get_version
+from users.models import Subscription
+
+
+class Viewer:
+    """Подписки, избранное и корзина текущего пользователя.
+    Каждое множество загружается одним запросом и живёт до конца запроса."""
+
+    def __init__(self, user):
+        self.user = user
+
+    @classmethod
+    def for_request(cls, request):
+        viewer = getattr(request, 'viewer', None)
+        if viewer is None:
+            viewer = cls(request.user if request else None)
+            if request is not None:
+                request.viewer = viewer
+        return viewer
+
+    @classmethod
+    def from_context(cls, context):
+        viewer = context.get('viewer')
+        if viewer is None:
+            viewer = cls.for_request(context.get('request'))
+            context['viewer'] = viewer
+        return viewer
+
+    @property
+    def is_authenticated(self):
+        return self.user is not None and self.user.is_authenticated
+
+    @property
+    def version_name(self):
+        return f'viewer:{self.user.pk}'
+
+    def version(self):
+        """Отметка последнего изменения подписок, избранного
+        или корзины пользователя; None для анонима."""
+        if not self.is_authenticated:
+            return None
+        return get_version(
+            self.version_name, settings.VIEWER_VERSION_TIMEOUT
+        )
+
+    def ids(self, queryset, field):
+        if not self.is_authenticated:
+            return frozenset()
+        return frozenset(
+            queryset.filter(user=self.user).values_list(field, flat=True)
+        )
+
+    @cached_property
+    def subscribed_author_ids(self):
+        return self.ids(Subscription.objects, 'author_id')
+
+    @cached_property
+    def favorite_recipe_ids(self):
+        return self.ids(FavoriteRecipes.objects, 'recipe_id')
+
+    @cached_property
+    def cart_recipe_ids(self):
+        return self.ids(ShoppingCart.objects, 'recipe_id')
+
+    def invalidate(self, *names):
+        for name in names:
+            self.__dict__.pop(name, None)
+        if self.is_authenticated:
+            bump_version(self.version_name, settings.VIEWER_VERSION_TIMEOUT)
+
+
+class ViewerContextMixin:
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['viewer'] = Viewer.for_request(self.request)
+        return context
@@ -1,55 +1,267 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Prefetch, Subquery
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters import rest_framework as filters
 from rest_framework import status, viewsets
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import ListAPIView
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from recipes.autocomplete import ingredient_index, normalize
+from recipes.counters import counters_version
+from recipes.matching import recipe_ingredient_index
 from recipes.models import (FavoriteRecipes, Ingredient, Recipe, ShoppingCart,
-                            Tag)
+                            ShoppingListItem, Tag)
+from recipes.recommendations import model_version, recommend
+from recipes.search import search_recipes
+from recipes.timeline import follow, timeline_sources, unfollow
+from recipes.versioning import get_version, version_time
 from users.models import Subscription, User
 
-from .filters import IngredientNameFilter, RecipeFilter
+from .cache import (ConditionalGetMixin, ReferenceCacheMixin, ingredient_cache,
+                    make_etag, tag_cache)
+from .exporters import EXPORTERS, get_exporter
+from .filters import RecipeFilter, RecipeOrderingFilter
+from .negotiation import ExportContentNegotiation
+from .pagination import (LimitPageNumberPagination, RecipePagination,
+                         TimelinePagination)
 from .permissions import IsAdminOrAuthorOrReadonly
 from .serializers import (FavoriteRecipesSerializer, IngredientSerializer,
-                          RecipeCreateUpdateSerializer, RecipeIngredient,
-                          RecipeListSerializer, ShoppingCartSerializer,
-                          SubscriptionSerializer, TagSerializer,
-                          UserSubscrptionSerializer)
+                          RecipeCreateUpdateSerializer, RecipeListSerializer,
+                          ShoppingCartSerializer, SubscriptionSerializer,
+                          TagSerializer, UserSubscrptionSerializer)
+from .sparse import Shape
+from .viewer import Viewer, ViewerContextMixin
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, ViewerContextMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
-    pagination_class = PageNumberPagination
+    pagination_class = RecipePagination
     permission_classes = (IsAdminOrAuthorOrReadonly,)
-    filter_backends = (filters.DjangoFilterBackend,)
+    filter_backends = (filters.DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count', 'cart_count')
+
+    def get_queryset(self):
+        if self.request.method == 'GET':
+            return Recipe.objects.only('id', 'pub_date', 'modified')
+        return Recipe.objects.all()
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeListSerializer
         return RecipeCreateUpdateSerializer
 
+    @action(detail=False, methods=('get',))
+    def search(self, request):
+        """Полнотекстовый поиск по названию и описанию с учётом
+        фильтров тегов, автора, избранного и корзины."""
+        return self.conditional(self.search_results, request)
+
+    def search_results(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': ['Введите поисковый запрос.']})
+        recipes = search_recipes(
+            self.filter_queryset(self.get_queryset()), query
+        )
+        paginator = LimitPageNumberPagination()
+        page = paginator.paginate_queryset(recipes, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=('get',))
+    def by_ingredients(self, request):
+        """Что приготовить из имеющихся ингредиентов: рецепты по убыванию
+        доли имеющихся ингредиентов и список недостающих."""
+        return self.conditional(self.matching_results, request)
+
+    def matching_results(self, request):
+        ingredient_ids, max_missing = self.parse_matching_params(request)
+        allowed = None
+        if RecipeFilter.base_filters.keys() & request.query_params.keys():
+            allowed = set(self.filter_queryset(
+                self.get_queryset()
+            ).values_list('id', flat=True))
+        matches = recipe_ingredient_index.match(
+            ingredient_ids,
+            settings.RECIPE_SEARCH_LIMIT,
+            max_missing=max_missing,
+            allowed=allowed,
+        )
+        paginator = LimitPageNumberPagination()
+        page = paginator.paginate_queryset(matches, request, view=self)
+        recipes = self.get_queryset().in_bulk(match.id for match in page)
+        page = [match for match in page if match.id in recipes]
+        missing = Ingredient.objects.in_bulk(
+            set().union(*(match.missing for match in page))
+        )
+        data = self.get_serializer(
+            [recipes[match.id] for match in page], many=True
+        ).data
+        for card, match in zip(data, page):
+            card['coverage'] = round(match.coverage, 3)
+            card['missing_ingredients'] = IngredientSerializer(
+                sorted(
+                    (missing[pk] for pk in match.missing if pk in missing),
+                    key=lambda ingredient: ingredient.name,
+                ),
+                many=True,
+            ).data
+        return paginator.get_paginated_response(data)
+
+    @action(
+        detail=False, methods=('get',), permission_classes=(IsAuthenticated,)
+    )
+    def recommended(self, request):
+        """Рекомендованные рецепты по избранному, корзине и подпискам
+        пользователя, без уже добавленных в избранное и корзину."""
+        return self.conditional(self.recommended_results, request)
+
+    def recommended_results(self, request):
+        viewer = Viewer.for_request(request)
+        recipe_ids = recommend(
+            request.user,
+            settings.RECOMMENDATIONS_LIMIT,
+            exclude=viewer.favorite_recipe_ids | viewer.cart_recipe_ids,
+        )
+        paginator = LimitPageNumberPagination()
+        page = paginator.paginate_queryset(recipe_ids, request, view=self)
+        recipes = self.get_queryset().in_bulk(page)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in page if pk in recipes], many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False, methods=('get',), permission_classes=(IsAuthenticated,)
+    )
+    def timeline(self, request):
+        """Лента рецептов авторов, на которых подписан пользователь,
+        от новых к старым, с навигацией по курсору."""
+        return self.conditional(self.timeline_results, request)
+
+    def timeline_results(self, request):
+        viewer = Viewer.for_request(request)
+        paginator = TimelinePagination()
+        page = paginator.paginate_queryset(
+            timeline_sources(request.user, viewer.subscribed_author_ids),
+            request,
+            view=self,
+        )
+        recipes = self.get_queryset().in_bulk(key.pk for key in page)
+        serializer = self.get_serializer(
+            [recipes[key.pk] for key in page if key.pk in recipes],
+            many=True,
+        )
+        return paginator.get_paginated_response(serializer.data)
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+    @staticmethod
+    def parse_matching_params(request):
+        try:
+            ingredient_ids = {
+                int(value)
+                for values in request.query_params.getlist('ingredients')
+                for value in values.split(',')
+                if value.strip()
+            }
+        except ValueError:
+            raise ValidationError({'ingredients': [
+                'Укажите id ингредиентов через запятую.'
+            ]})
+        if not ingredient_ids:
+            raise ValidationError({'ingredients': [
+                'Укажите хотя бы один ингредиент.'
+            ]})
+        max_missing = request.query_params.get('max_missing')
+        if max_missing is None:
+            return ingredient_ids, None
+        try:
+            max_missing = int(max_missing)
+        except ValueError:
+            max_missing = -1
+        if max_missing < 0:
+            raise ValidationError({'max_missing': [
+                'Укажите неотрицательное целое число.'
+            ]})
+        return ingredient_ids, max_missing
+
+    def get_validators(self, request):
+        viewer_version = Viewer.for_request(request).version()
+        stamps = [version_time(viewer_version)] if viewer_version else []
+        if self.action == 'retrieve':
+            try:
+                recipe = Recipe.objects.filter(
+                    pk=self.kwargs['pk']
+                ).values_list('pub_date', 'modified').first()
+            except (TypeError, ValueError):
+                recipe = None
+            if recipe is None:
+                return None, None
+            validator = (self.kwargs['pk'], *recipe)
+            stamps.append(int(recipe[1].timestamp()))
+        else:
+            versions = [get_version('recipes')]
+            if self.action == 'recommended':
+                versions.append(model_version())
+            if OrderingFilter.ordering_param in request.query_params:
+                versions.append(counters_version())
+            stamps.extend(version_time(version) for version in versions)
+            validator = tuple(versions)
+        etag = make_etag(
+            validator,
+            viewer_version,
+            request.get_full_path(),
+            request.get_host(),
+            request.accepted_renderer.format,
+        )
+        if None in stamps:
+            return etag, None
+        return etag, max(stamps)
+
+
+class IngredientViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
-    filter_backends = (IngredientNameFilter, )
-    search_fields = ('^name', )
+    reference_cache = ingredient_cache
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = int(request.query_params.get(
+                'limit', settings.INGREDIENT_SEARCH_LIMIT
+            ))
+        except ValueError:
+            raise ValidationError({'limit': ['Укажите целое число.']})
+        limit = max(1, min(limit, settings.INGREDIENT_SEARCH_LIMIT))
+        return self.cached_response(
+            request,
+            f'search:{limit}:{normalize(name)}',
+            lambda: self.get_serializer(
+                ingredient_index.search(name, limit), many=True
+            ).data,
+            store=False,
+        )
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
+    reference_cache = tag_cache
 
 
 class ShoppingCartView(APIView):
@@ -68,7 +280,10 @@ class ShoppingCartView(APIView):
                 data=data, context={'request': request}
             )
             if serializer.is_valid():
-                serializer.save()
+                with transaction.atomic():
+                    serializer.save()
+                    ShoppingListItem.objects.add_recipe(request.user, recipe)
+                Viewer.for_request(request).invalidate('cart_recipe_ids')
                 return Response(
                     serializer.data, status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -77,32 +292,42 @@ class ShoppingCartView(APIView):
         recipe = get_object_or_404(Recipe, id=id)
         if ShoppingCart.objects.filter(
            user=request.user, recipe=recipe).exists():
-            ShoppingCart.objects.filter(
-                user=request.user, recipe=recipe
-            ).delete()
+            with transaction.atomic():
+                ShoppingCart.objects.filter(
+                    user=request.user, recipe=recipe
+                ).delete()
+                ShoppingListItem.objects.remove_recipe(request.user, recipe)
+            Viewer.for_request(request).invalidate('cart_recipe_ids')
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['GET'])
-@permission_classes([IsAdminOrAuthorOrReadonly])
-def download_shopping_list(request):
-    ingredients = RecipeIngredient.objects.filter(
-        recipe__shopping_cart__user=request.user
-    ).values(
-        'ingredients__name', 'ingredients__measurement_unit'
-    ).annotate(amount=Sum('amount'))
-    shopping_list = []
-    for index in range(len(ingredients)):
-        shopping_list.append(
-            f"{ingredients[index]['ingredients__name']} - "
-            f"{ingredients[index]['amount']} "
-            f"{ingredients[index]['ingredients__measurement_unit']}\n"
+class DownloadShoppingListView(APIView):
+    permission_classes = (IsAuthenticated,)
+    content_negotiation_class = ExportContentNegotiation
+
+    def get(self, request):
+        export_format = request.query_params.get('format', 'txt')
+        exporter = get_exporter(export_format)
+        if exporter is None:
+            raise ValidationError({'format': [
+                f'Доступные форматы: {", ".join(EXPORTERS)}.'
+            ]})
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values(
+            'amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        ).order_by('name')
+        response = StreamingHttpResponse(
+            exporter(ingredients.iterator()),
+            content_type=exporter.content_type,
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{exporter.format}"'
         )
-    filename = 'shopping_list'
-    response = HttpResponse(shopping_list, 'Content-Type: application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{filename}.pdf"'
-    return response
+        return response
 
 
 class FavoriteRecipesView(APIView):
@@ -121,6 +346,7 @@ class FavoriteRecipesView(APIView):
             )
             if serializer.is_valid():
                 serializer.save()
+                Viewer.for_request(request).invalidate('favorite_recipe_ids')
                 return Response(
                     serializer.data, status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -132,6 +358,7 @@ class FavoriteRecipesView(APIView):
             FavoriteRecipes.objects.filter(
                 user=request.user, recipe=recipe
             ).delete()
+            Viewer.for_request(request).invalidate('favorite_recipe_ids')
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -149,7 +376,9 @@ class SubscriptionView(APIView):
         )
 
         if serializer.is_valid():
-            serializer.save()
+            subscription = serializer.save()
+            follow(request.user, subscription.author)
+            Viewer.for_request(request).invalidate('subscribed_author_ids')
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
@@ -166,22 +395,39 @@ class SubscriptionView(APIView):
                 author=author
             )
             subscription.delete()
+            unfollow(request.user, author)
+            Viewer.for_request(request).invalidate('subscribed_author_ids')
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserSubscriptionsView(ListAPIView):
+class UserSubscriptionsView(ViewerContextMixin, ListAPIView):
 
     permission_classes = (IsAuthenticated,)
-    pagination_class = PageNumberPagination
+    pagination_class = LimitPageNumberPagination
+    serializer_class = UserSubscrptionSerializer
 
-    def get(self, request):
-        user = request.user
+    def get_queryset(self):
+        """Авторы, на которых подписан пользователь. recipes_count
+        хранится в строке автора, а последние recipes_limit рецептов
+        каждого автора подгружаются одним запросом: для каждого рецепта
+        подзапрос по индексу (author, pub_date) проверяет, что он среди
+        последних рецептов своего автора."""
+        user = self.request.user
+        shape = Shape.for_request(self.request)
         queryset = User.objects.filter(author__user=user)
-        page = self.paginate_queryset(queryset)
-        serializer = UserSubscrptionSerializer(
-            page,
-            many=True,
-            context={'request': request}
+        if not shape.includes('recipes'):
+            return queryset
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        if shape.collapses('recipes'):
+            recipes = recipes.only('id', 'author')
+        limit = UserSubscrptionSerializer.get_recipes_limit(self.request)
+        if limit is not None:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).order_by('-pub_date', '-id').values('id')[:limit]
+            ))
+        return queryset.prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='latest_recipes')
         )
-        return self.get_paginated_response(serializer.data)
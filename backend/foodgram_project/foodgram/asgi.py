@@ -0,0 +1,25 @@
+"""
+ASGI config for foodgram project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+os.environ.setdefault('ASYNC_VIEWS', 'true')
+
+django.setup(set_prefix=False)
+
+from api.asynchronous import (ASGIHandler, call_in_worker,  # noqa: E402
+                              get_executor)
+from recipes.autocomplete import warm_up  # noqa: E402
+
+application = ASGIHandler()
+
+get_executor().submit(call_in_worker, warm_up)
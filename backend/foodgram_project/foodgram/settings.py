@@ -4,20 +4,21 @@ Django settings for foodgram project.
 Generated by 'django-admin startproject' using Django 2.2.19.
 
 For more information on this file, see
-https://docs.djangoproject.com/en/2.2/topics/settings/
+https://docs.djangoproject.com/en/3.2/topics/settings/
 
 For the full list of settings and their values, see
-https://docs.djangoproject.com/en/2.2/ref/settings/
+https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
 # Quick-start development settings - unsuitable for production
-# See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
+# See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = os.getenv('SECRET_KEY', default='secret_key')
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,9 +77,15 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', default='false') == 'true'
+ASYNC_DB_WORKERS = int(os.getenv('ASYNC_DB_WORKERS', default=8))
+
+
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
 
 # Database
-# https://docs.djangoproject.com/en/2.2/ref/settings/#databases
+# https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
 DATABASES = {
     'default': {
@@ -91,8 +99,94 @@ DATABASES = {
 }
 
 
+FILE_CACHE_BACKEND = 'django.core.cache.backends.filebased.FileBasedCache'
+
+# Карточки рецептов хранятся отдельно, чтобы не вытеснять остальные
+# записи. По умолчанию это память процесса с лимитом на самые ходовые
+# карточки: файловый кеш перечисляет весь каталог при каждой записи.
+# Для общего кеша на весь каталог задайте CARDS_CACHE_BACKEND и
+# CARDS_CACHE_LOCATION, например memcached.
+# Версии наборов данных не должны вытесняться никогда, иначе процессы
+# будут молча пересобирать индексы в памяти, поэтому они хранятся
+# в отдельном каталоге, который никогда не заполняется до лимита.
+# Если процессы работают на разных серверах, VERSIONS_CACHE_BACKEND
+# и VERSIONS_CACHE_LOCATION должны указывать на общее хранилище.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', default=FILE_CACHE_BACKEND),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_cache')
+        ),
+    },
+    'cards': {
+        'BACKEND': os.getenv(
+            'CARDS_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CARDS_CACHE_LOCATION', default='cards'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv(
+                'CARDS_CACHE_MAX_ENTRIES', default=10000
+            )),
+        },
+    },
+    'versions': {
+        'BACKEND': os.getenv(
+            'VERSIONS_CACHE_BACKEND', default=FILE_CACHE_BACKEND
+        ),
+        'LOCATION': os.getenv(
+            'VERSIONS_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_versions')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10 ** 9,
+        },
+    },
+}
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+
+RECIPE_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+VIEWER_VERSION_TIMEOUT = 60 * 60 * 24
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='false') == 'true'
+METRICS_SERVER_TIMING = METRICS_ENABLED and os.getenv(
+    'METRICS_SERVER_TIMING', default='false'
+) == 'true'
+METRICS_ALLOWED_IPS = os.getenv(
+    'METRICS_ALLOWED_IPS', default='127.0.0.1,::1'
+).split(',')
+METRICS_FLUSH_INTERVAL = 10
+METRICS_WORKER_TIMEOUT = 3 * METRICS_FLUSH_INTERVAL
+METRICS_WORKER_SLOTS = 64
+METRICS_DUPLICATE_THRESHOLD = 3
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'metrics': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'plain',
+        },
+    },
+    'loggers': {
+        'foodgram.metrics': {
+            'handlers': ['metrics'],
+            'level': os.getenv('METRICS_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
-# https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
+# https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -111,7 +205,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 
 # Internationalization
-# https://docs.djangoproject.com/en/2.2/topics/i18n/
+# https://docs.djangoproject.com/en/3.2/topics/i18n/
 
 LANGUAGE_CODE = 'en-us'
 
@@ -125,7 +219,7 @@ USE_TZ = True
 
 
 # Static files (CSS, JavaScript, Images)
-# https://docs.djangoproject.com/en/2.2/howto/static-files/
+# https://docs.djangoproject.com/en/3.2/howto/static-files/
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
@@ -133,6 +227,9 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+IMAGE_QUALITY = 82
+
 AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
@@ -163,3 +260,19 @@ DJOSER = {
 }
 
 ROLES = ('user', 'admin')
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', default=20))
+
+RECIPE_SEARCH_LIMIT = int(os.getenv('RECIPE_SEARCH_LIMIT', default=1000))
+
+RECOMMENDATIONS_LIMIT = int(os.getenv('RECOMMENDATIONS_LIMIT', default=100))
+
+# Длина ленты подписок и число подписчиков, начиная с которого рецепты
+# автора не рассылаются по лентам, а читаются при запросе ленты.
+TIMELINE_LENGTH = int(os.getenv('TIMELINE_LENGTH', default=500))
+TIMELINE_FANOUT_LIMIT = int(os.getenv('TIMELINE_FANOUT_LIMIT', default=1000))
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
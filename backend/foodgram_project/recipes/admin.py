@@ -1,7 +1,9 @@
 from django.contrib import admin
+from django.db import transaction
 
+from .images import reset_variants, schedule_variants
 from .models import (FavoriteRecipes, Ingredient, Recipe, RecipeTag,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
 
 
 class IngredientInline(admin.TabularInline):
@@ -15,14 +17,30 @@ class TagInline(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorites')
+    list_display = ('name', 'author', 'favorites_count', 'cart_count')
     list_filter = ('author', 'name', 'tags')
     search_fields = ('tags__name',)
     inlines = (IngredientInline, TagInline)
-
-    def favorites(self, obj):
-        if FavoriteRecipes.objects.filter(recipe=obj).exists():
-            return FavoriteRecipes.objects.filter(recipe=obj).count()
+    readonly_fields = (
+        'thumbnail', 'card_image', 'full_image',
+        'favorites_count', 'cart_count',
+    )
+
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            reset_variants(obj)
+        super().save_model(request, obj, form, change)
+        if not obj.thumbnail:
+            schedule_variants(obj)
+
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        old_amounts = ShoppingListItem.objects.recipe_amounts(recipe)
+        super().save_related(request, form, formsets, change)
+        ShoppingListItem.objects.change_recipe(
+            recipe, old_amounts,
+            ShoppingListItem.objects.recipe_amounts(recipe),
+        )
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -43,9 +61,33 @@ class FavoritesAdmin(admin.ModelAdmin):
 
 
 class ShoppingCartAdmin(admin.ModelAdmin):
+    """Изменения корзин переносятся в списки покупок так же,
+    как при изменении через API."""
+
     list_display = ('user', 'recipe')
     search_fields = ('user__username', 'user__email')
 
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = ShoppingCart.objects.select_related(
+                'user', 'recipe'
+            ).get(pk=obj.pk)
+            ShoppingListItem.objects.remove_recipe(old.user, old.recipe)
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.objects.add_recipe(obj.user, obj.recipe)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        ShoppingListItem.objects.remove_recipe(obj.user, obj.recipe)
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        for cart in queryset.select_related('user', 'recipe'):
+            ShoppingListItem.objects.remove_recipe(cart.user, cart.recipe)
+        super().delete_queryset(request, queryset)
+
 
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
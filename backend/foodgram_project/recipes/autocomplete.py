@@ -0,0 +1,60 @@
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.db import DatabaseError
+
+from .models import Ingredient
+from .versioning import VersionedIndex
+
+IngredientEntry = namedtuple(
+    'IngredientEntry', ('id', 'name', 'measurement_unit')
+)
+
+
+def normalize(text):
+    return ' '.join(text.casefold().replace('ё', 'е').split())
+
+
+class IngredientIndex(VersionedIndex):
+    version_name = 'ingredients'
+
+    def build(self):
+        entries = sorted(
+            (normalize(name), IngredientEntry(pk, name, unit))
+            for pk, name, unit in Ingredient.objects.order_by().values_list(
+                'id', 'name', 'measurement_unit'
+            ).iterator()
+        )
+        return (
+            [key for key, _ in entries],
+            [entry for _, entry in entries],
+        )
+
+    def search(self, query, limit):
+        keys, entries = self.get()
+        query = normalize(query)
+        found = []
+        position = bisect_left(keys, query)
+        while (
+            position < len(keys) and len(found) < limit
+            and keys[position].startswith(query)
+        ):
+            found.append(entries[position])
+            position += 1
+        if len(found) < limit:
+            for key, entry in zip(keys, entries):
+                if query in key and not key.startswith(query):
+                    found.append(entry)
+                    if len(found) == limit:
+                        break
+        return found
+
+
+ingredient_index = IngredientIndex()
+
+
+def warm_up():
+    try:
+        ingredient_index.get()
+    except DatabaseError:
+        pass
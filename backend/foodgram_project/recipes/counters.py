@@ -0,0 +1,136 @@
+import threading
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Subscription, User
+
+from .models import FavoriteRecipes, Recipe, ShoppingCart
+from .versioning import bump_version, get_version
+
+VERSION_NAME = 'counters'
+BATCH_SIZE = 500
+
+_pending = threading.local()
+
+COUNTERS = {
+    'favorites_count': (Recipe, FavoriteRecipes, 'recipe'),
+    'cart_count': (Recipe, ShoppingCart, 'recipe'),
+    'recipes_count': (User, Recipe, 'author'),
+    'followers_count': (User, Subscription, 'author'),
+}
+
+
+def counters_version():
+    """Меняется при каждом изменении счётчиков."""
+    return get_version(VERSION_NAME)
+
+
+def change_counter(name, pk, delta):
+    """Прибавляет delta к счётчику одним UPDATE с F(), без чтения
+    значения в Python."""
+    if not delta:
+        return
+    model = COUNTERS[name][0]
+    model.objects.filter(pk=pk).update(**{name: F(name) + delta})
+    transaction.on_commit(lambda: bump_version(VERSION_NAME))
+
+
+class PendingChanges:
+    """Изменения счётчиков, накопленные в транзакции. После фиксации
+    применяются одним UPDATE на каждую пару (счётчик, изменение), так что
+    каскадное удаление пользователя или рецепта не превращается в UPDATE
+    на каждую удалённую строку."""
+
+    def __init__(self, savepoints):
+        self.savepoints = savepoints
+        self.changes = defaultdict(int)
+
+    def add(self, name, pk, delta):
+        self.changes[name, pk] += delta
+
+    def __call__(self):
+        if getattr(_pending, 'changes', None) is self:
+            _pending.changes = None
+        groups = defaultdict(list)
+        for (name, pk), delta in self.changes.items():
+            if delta:
+                groups[name, delta].append(pk)
+        for (name, delta), pks in groups.items():
+            model = COUNTERS[name][0]
+            for start in range(0, len(pks), BATCH_SIZE):
+                model.objects.filter(
+                    pk__in=pks[start:start + BATCH_SIZE]
+                ).update(**{name: F(name) + delta})
+        if groups:
+            bump_version(VERSION_NAME)
+
+
+def defer_change(name, pk, delta):
+    """Как change_counter, но внутри транзакции откладывает изменение
+    до её фиксации и объединяет его с остальными. Изменения копятся
+    отдельно для каждой точки сохранения, поэтому при её откате
+    пропадают вместе с зарегистрированным обработчиком."""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        change_counter(name, pk, delta)
+        return
+    savepoints = tuple(connection.savepoint_ids)
+    pending = getattr(_pending, 'changes', None)
+    if pending is None or pending.savepoints != savepoints or not any(
+        func is pending for _, func in connection.run_on_commit
+    ):
+        pending = _pending.changes = PendingChanges(savepoints)
+        transaction.on_commit(pending)
+    pending.add(name, pk, delta)
+
+
+def actual_count(name):
+    """Выражение с числом связанных строк для UPDATE счётчика."""
+    _, related, key = COUNTERS[name]
+    return Coalesce(
+        Subquery(
+            related.objects.filter(**{key: OuterRef('pk')}).order_by(
+            ).values(key).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def find_drift(name):
+    """Id объектов, у которых счётчик расходится с числом связанных
+    строк."""
+    model, related, key = COUNTERS[name]
+    expected = dict(
+        related.objects.values_list(key).annotate(
+            total=Count('pk')
+        ).order_by()
+    )
+    return [
+        pk for pk, value in model.objects.values_list(
+            'pk', name
+        ).order_by().iterator()
+        if value != expected.get(pk, 0)
+    ]
+
+
+def reconcile(names=None):
+    """Пересчитывает расходящиеся счётчики в самой БД, чтобы не затереть
+    изменения, сделанные после сверки. Возвращает число исправленных
+    объектов по каждому счётчику."""
+    fixed = {}
+    for name in names or COUNTERS:
+        model = COUNTERS[name][0]
+        drifted = find_drift(name)
+        with transaction.atomic():
+            for start in range(0, len(drifted), BATCH_SIZE):
+                model.objects.filter(
+                    pk__in=drifted[start:start + BATCH_SIZE]
+                ).update(**{name: actual_count(name)})
+        fixed[name] = len(drifted)
+    if any(fixed.values()):
+        bump_version(VERSION_NAME)
+    return fixed
@@ -0,0 +1,129 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .models import Recipe
+from .versioning import bump_version
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'thumbnail': (160, 160),
+    'card_image': (480, 480),
+    'full_image': (1280, 1280),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+    return _executor
+
+
+def output_format():
+    if features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def resize(source, size, image_format):
+    image = source.copy()
+    image.thumbnail(size, Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=settings.IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def render_variants(recipe_id, image_name):
+    """Сохраняет уменьшенные копии картинки рецепта. Если картинку
+    успели заменить, пока задача ждала очереди, ничего не делает."""
+    recipe = Recipe.objects.filter(pk=recipe_id, image=image_name).first()
+    if recipe is None:
+        return False
+    image_format, extension = output_format()
+    with recipe.image.open('rb') as image_file:
+        source = ImageOps.exif_transpose(Image.open(image_file))
+        source = source.convert('RGB')
+    stem = image_name.rsplit('/', 1)[-1].rsplit('.', 1)[0]
+    fields = {}
+    for field, size in VARIANTS.items():
+        fields[field] = getattr(recipe, field).storage.save(
+            f'recipes/variants/{recipe_id}/{stem}-{field}.{extension}',
+            ContentFile(resize(source, size, image_format)),
+        )
+    updated = Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        modified=timezone.now(), **fields
+    )
+    if updated:
+        bump_version('recipes')
+    return bool(updated)
+
+
+def try_render_variants(recipe_id, image_name):
+    """render_variants, ошибки которого только пишутся в лог: рецепт
+    уже сохранён, и без уменьшенных копий он отдаётся с исходной
+    картинкой."""
+    try:
+        return render_variants(recipe_id, image_name)
+    except Exception:
+        logger.exception(
+            'Не удалось подготовить картинки рецепта %s', recipe_id
+        )
+        return False
+
+
+def run_render_variants(recipe_id, image_name):
+    try:
+        return try_render_variants(recipe_id, image_name)
+    finally:
+        connection.close()
+
+
+def delete_files(files):
+    for storage, name in files:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.exception('Не удалось удалить файл %s', name)
+
+
+def reset_variants(recipe):
+    """Отвязывает от рецепта копии прежней картинки и удаляет их файлы
+    после фиксации транзакции."""
+    files = []
+    for field in VARIANTS:
+        variant = getattr(recipe, field)
+        if variant:
+            files.append((variant.storage, variant.name))
+        setattr(recipe, field, '')
+    if files:
+        transaction.on_commit(lambda: delete_files(files))
+
+
+def schedule_variants(recipe):
+    """Ставит пересчёт картинок в очередь после фиксации транзакции.
+    При IMAGE_WORKERS = 0 картинки готовятся сразу, в том же потоке."""
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    if not settings.IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: try_render_variants(recipe_id, image_name)
+        )
+        return
+    transaction.on_commit(lambda: get_executor().submit(
+        run_render_variants, recipe_id, image_name
+    ))
@@ -0,0 +1,53 @@
+import threading
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import Recipe
+from .versioning import get_version
+
+
+class RecipeIndex:
+    """Структура в памяти процесса, построенная по рецептам. Когда
+    меняется версия recipes, догружает только рецепты, изменённые после
+    прошлого обновления, и выбрасывает удалённые. Запас overlap покрывает
+    транзакции, которые сохранили рецепт раньше, а зафиксировались позже
+    обновления индекса."""
+
+    version_name = 'recipes'
+    overlap = timedelta(minutes=1)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._version = None
+        self._watermark = None
+
+    def load(self, recipes):
+        """Индексирует рецепты из queryset заново."""
+        raise NotImplementedError
+
+    def remove(self, pk):
+        raise NotImplementedError
+
+    def indexed_ids(self):
+        raise NotImplementedError
+
+    def refresh(self):
+        """Вызывается под self.lock."""
+        version = get_version(self.version_name)
+        if version == self._version:
+            return
+        started = timezone.now()
+        recipes = Recipe.objects.order_by()
+        if self._watermark is not None:
+            recipes = recipes.filter(
+                modified__gte=self._watermark - self.overlap
+            )
+        self.load(recipes)
+        indexed = self.indexed_ids()
+        if Recipe.objects.count() != len(indexed):
+            existing = set(Recipe.objects.values_list('id', flat=True))
+            for pk in indexed - existing:
+                self.remove(pk)
+        self._watermark = started
+        self._version = version
@@ -0,0 +1,291 @@
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.counters import reconcile as reconcile_counters
+from recipes.models import (FavoriteRecipes, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, ShoppingCart,
+                            ShoppingListItem, Tag)
+from recipes.search import update_search_vectors
+from recipes.timeline import rebuild as rebuild_timelines
+from recipes.versioning import bump_version
+from users.models import Subscription, User
+
+BATCH_SIZE = 500
+IMAGE_NAME = 'recipes/synthetic.png'
+IMAGE = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360f8cfc0f01f0005000201ae2c5d'
+    '6a0000000049454e44ae426082'
+)
+WORDS = (
+    'томлёная', 'запечённая', 'быстрая', 'домашняя', 'острая', 'летняя',
+    'курица', 'паста', 'похлёбка', 'запеканка', 'лапша', 'каша', 'салат',
+    'с грибами', 'с сыром', 'по-деревенски', 'с зеленью', 'на гриле',
+)
+
+
+class Skewed:
+    """Выбор с распределением Ципфа: немногие элементы популярны,
+    большинство встречается редко."""
+
+    def __init__(self, items, exponent, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.rng = rng
+        self.cum_weights = list(accumulate(
+            1 / (rank + 1) ** exponent for rank in range(len(self.items))
+        ))
+
+    def pick(self):
+        return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+
+    def sample(self, count, exclude=None):
+        count = min(count, len(self.items) - (exclude is not None))
+        chosen = set()
+        for _ in range(count * 10):
+            if len(chosen) >= count:
+                break
+            item = self.pick()
+            if item != exclude:
+                chosen.add(item)
+        return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт синтетических пользователей, рецепты, теги, подписки, '
+        'избранное и корзины с неравномерным распределением популярности.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--tags', type=int, default=12)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, nargs=2, default=(3, 12),
+            metavar=('MIN', 'MAX'),
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=8,
+            help='Среднее число подписок на пользователя.',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=15,
+            help='Среднее число избранных рецептов на пользователя.',
+        )
+        parser.add_argument(
+            '--cart', type=int, default=4,
+            help='Среднее число рецептов в корзине пользователя.',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степени распределения Ципфа.',
+        )
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument(
+            '--prefix', default='synthetic',
+            help='Префикс имён создаваемых пользователей и тегов.',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.started = time.monotonic()
+        if options['users'] < 2:
+            raise CommandError('Нужно хотя бы два пользователя.')
+        with transaction.atomic():
+            users = self.create_users()
+            tags = self.create_tags()
+            ingredients = self.ensure_ingredients()
+            authors = Skewed(users, options['skew'], self.rng)
+            recipes = self.create_recipes(authors)
+            self.link_recipes(recipes, tags, ingredients)
+            popular = Skewed(recipes, options['skew'], self.rng)
+            self.create_subscriptions(users, authors)
+            favorites = self.create_choices(
+                FavoriteRecipes, users, popular, options['favorites']
+            )
+            cart = self.create_choices(
+                ShoppingCart, users, popular, options['cart']
+            )
+            self.stage(f'избранное: {favorites}, корзины: {cart}')
+            ShoppingListItem.objects.rebuild(users)
+            self.stage('списки покупок пересобраны')
+            rebuild_timelines(users)
+            self.stage('ленты подписок пересобраны')
+            reconcile_counters()
+            self.stage('счётчики пересчитаны')
+        for name in ('recipes', 'tags', 'ingredients'):
+            bump_version(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - self.started:.1f} с.'
+        ))
+
+    def stage(self, message):
+        self.stdout.write(
+            f'[{time.monotonic() - self.started:7.1f} с] {message}'
+        )
+
+    def variation(self, mean):
+        return max(0, round(self.rng.expovariate(1 / mean))) if mean else 0
+
+    def create_users(self):
+        prefix = self.options['prefix']
+        start = User.objects.filter(username__startswith=prefix).count()
+        password = make_password(None)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}{index}',
+                    email=f'{prefix}{index}@foodgram.local',
+                    first_name='Синтетический',
+                    last_name=f'Пользователь {index}',
+                    password=password,
+                )
+                for index in range(start, start + self.options['users'])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        users = list(User.objects.filter(
+            username__startswith=prefix
+        ).order_by('pk').values_list('pk', flat=True)[start:])
+        self.stage(f'пользователи: {len(users)}')
+        return users
+
+    def create_tags(self):
+        prefix = self.options['prefix']
+        existing = list(Tag.objects.values_list('pk', flat=True))
+        missing = self.options['tags'] - len(existing)
+        if missing > 0:
+            colors = set(Tag.objects.values_list('color', flat=True))
+            names = set(Tag.objects.values_list('name', flat=True))
+            new_tags = []
+            index = 0
+            while len(new_tags) < missing:
+                color = f'#{self.rng.randrange(0x1000000):06X}'
+                name = f'{prefix}-{index}'
+                index += 1
+                if color in colors or name in names:
+                    continue
+                colors.add(color)
+                new_tags.append(Tag(name=name, color=color, slug=name))
+            Tag.objects.bulk_create(new_tags)
+        tags = list(Tag.objects.values_list('pk', flat=True))
+        self.stage(f'теги: {len(tags)}')
+        return Skewed(tags, self.options['skew'], self.rng)
+
+    def ensure_ingredients(self):
+        minimum = self.options['ingredients_per_recipe'][1] * 10
+        count = Ingredient.objects.count()
+        if count < minimum:
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(
+                        name=f'{self.options["prefix"]} ингредиент {index}',
+                        measurement_unit='г',
+                    )
+                    for index in range(count, minimum)
+                ),
+                batch_size=BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+        ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+        self.stage(f'ингредиенты: {len(ingredients)}')
+        return Skewed(ingredients, self.options['skew'], self.rng)
+
+    def create_recipes(self, authors):
+        if not default_storage.exists(IMAGE_NAME):
+            default_storage.save(IMAGE_NAME, ContentFile(IMAGE))
+        last_id = Recipe.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=authors.pick(),
+                    name=' '.join(self.rng.sample(WORDS, 3)).capitalize(),
+                    image=IMAGE_NAME,
+                    text='Синтетический рецепт для нагрузочных проверок.',
+                    cooking_time=self.rng.randint(5, 180),
+                )
+                for _ in range(self.options['recipes'])
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        now = timezone.now()
+        recipes = list(Recipe.objects.filter(pk__gt=last_id).only('pk'))
+        for recipe in recipes:
+            recipe.pub_date = recipe.modified = now - timedelta(
+                seconds=self.rng.randrange(self.options['days'] * 86400)
+            )
+        Recipe.objects.bulk_update(
+            recipes, ('pub_date', 'modified'), batch_size=BATCH_SIZE
+        )
+        update_search_vectors(Recipe.objects.filter(pk__gt=last_id))
+        self.stage(f'рецепты: {len(recipes)}')
+        return [recipe.pk for recipe in recipes]
+
+    def link_recipes(self, recipes, tags, ingredients):
+        low, high = self.options['ingredients_per_recipe']
+        RecipeTag.objects.bulk_create(
+            (
+                RecipeTag(recipe_id=recipe_id, tags_id=tag_id)
+                for recipe_id in recipes
+                for tag_id in tags.sample(self.rng.randint(1, 3))
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredients_id=ingredient_id,
+                    amount=self.rng.choice((1, 2, 5, 10, 50, 100, 250)),
+                )
+                for recipe_id in recipes
+                for ingredient_id in ingredients.sample(
+                    self.rng.randint(low, high)
+                )
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        self.stage('теги и ингредиенты рецептов')
+
+    def create_subscriptions(self, users, authors):
+        Subscription.objects.bulk_create(
+            (
+                Subscription(user_id=user_id, author_id=author_id)
+                for user_id in users
+                for author_id in authors.sample(
+                    self.variation(self.options['subscriptions']),
+                    exclude=user_id,
+                )
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        self.stage(
+            f'подписки: {Subscription.objects.filter(user__in=users).count()}'
+        )
+
+    def create_choices(self, model, users, recipes, mean):
+        model.objects.bulk_create(
+            (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in users
+                for recipe_id in recipes.sample(self.variation(mean))
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        return model.objects.filter(user__in=users).count()
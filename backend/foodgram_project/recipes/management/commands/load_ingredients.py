@@ -0,0 +1,145 @@
+import csv
+import json
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import Ingredient
+from recipes.versioning import bump_version
+
+BATCH_SIZE = 500
+CHUNK_SIZE = 64 * 1024
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def read_csv(ingredient_file):
+    for row in csv.reader(ingredient_file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(ingredient_file):
+    """Читает массив объектов по частям, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if not started and position < len(buffer):
+            if buffer[position] != '[':
+                raise CommandError('JSON-файл должен содержать массив.')
+            started = True
+            position += 1
+            continue
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Некорректный JSON-файл.')
+            chunk = ingredient_file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        position = end
+        if isinstance(item, dict):
+            yield item.get('name'), item.get('measurement_unit')
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает справочник ингредиентов из CSV (name,measurement_unit) '
+        'или JSON. Уже существующие пары пропускаются, поэтому команду '
+        'можно запускать повторно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы справочника.')
+        parser.add_argument(
+            '--format',
+            choices=sorted(READERS),
+            help='Формат файлов; по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Размер пачки для bulk_create.',
+        )
+        parser.add_argument(
+            '--progress',
+            type=int,
+            default=10000,
+            help='Выводить прогресс каждые N строк.',
+        )
+
+    def handle(self, *args, **options):
+        before = Ingredient.objects.count()
+        started = time.monotonic()
+        processed = skipped = 0
+        for path in options['paths']:
+            reader = READERS.get(
+                options['format'] or path.rsplit('.', 1)[-1].lower()
+            )
+            if reader is None:
+                raise CommandError(
+                    f'Не удалось определить формат файла {path}.'
+                )
+            try:
+                with open(path, encoding='utf-8') as ingredient_file:
+                    rows = self.clean(reader(ingredient_file))
+                    while True:
+                        batch = list(islice(rows, options['batch_size']))
+                        if not batch:
+                            break
+                        Ingredient.objects.bulk_create(
+                            batch, ignore_conflicts=True
+                        )
+                        total = processed + len(batch)
+                        if total // options['progress'] > (
+                            processed // options['progress']
+                        ):
+                            self.report(total, started)
+                        processed = total
+            except OSError as error:
+                raise CommandError(f'Не удалось прочитать {path}: {error}')
+            skipped += self.rejected
+        created = Ingredient.objects.count() - before
+        if created:
+            bump_version('ingredients')
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {processed}, добавлено: {created}, '
+            f'уже было: {processed - created}, отброшено: {skipped}. '
+            f'{elapsed:.2f} с, {processed / elapsed:.0f} строк/с.'
+        ))
+
+    def clean(self, rows):
+        self.rejected = 0
+        for name, measurement_unit in rows:
+            name = (name or '').strip()
+            measurement_unit = (measurement_unit or '').strip()
+            if (
+                not name or not measurement_unit
+                or len(name) > NAME_LENGTH
+                or len(measurement_unit) > UNIT_LENGTH
+            ):
+                self.rejected += 1
+                continue
+            yield Ingredient(name=name, measurement_unit=measurement_unit)
+
+    def report(self, processed, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(
+            f'{processed} строк, {processed / elapsed:.0f} строк/с'
+        )
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет сводные списки покупок с корзинами пользователей '
+        'и пересобирает расходящиеся.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить, ничего не изменяя.',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересобрать списки всех пользователей с нуля.',
+        )
+
+    def handle(self, *args, **options):
+        if options['all'] and not options['check']:
+            ShoppingListItem.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                'Списки покупок пересобраны.'
+            ))
+            return
+        drifted = self.find_drift()
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS(
+                'Списки покупок согласованы с корзинами.'
+            ))
+            return
+        if options['check']:
+            raise CommandError(
+                f'Расхождения у пользователей: '
+                f'{", ".join(map(str, sorted(drifted)))}.'
+            )
+        ShoppingListItem.objects.rebuild(drifted)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобраны списки покупок {len(drifted)} пользователей.'
+        ))
+
+    def find_drift(self):
+        expected = ShoppingListItem.objects.expected_totals().iterator()
+        stored = ShoppingListItem.objects.values_list(
+            'user', 'ingredient', 'amount'
+        ).order_by('user_id', 'ingredient_id').iterator()
+        drifted = set()
+        left, right = next(expected, None), next(stored, None)
+        while left is not None or right is not None:
+            if right is None or (
+                left is not None and left[:2] < right[:2]
+            ):
+                drifted.add(left[0])
+                left = next(expected, None)
+            elif left is None or right[:2] < left[:2]:
+                drifted.add(right[0])
+                right = next(stored, None)
+            else:
+                if left[2] != right[2]:
+                    drifted.add(left[0])
+                left, right = next(expected, None), next(stored, None)
+        return drifted
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.timeline import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает ленты подписок по текущим подпискам, например '
+        'после загрузки данных в обход API или изменения TIMELINE_LENGTH.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, nargs='+', metavar='ID',
+            help='Пересобрать ленты только этих пользователей.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rebuild(options['users'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты подписок пересобраны за '
+            f'{time.monotonic() - started:.1f} с.'
+        ))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.counters import COUNTERS, find_drift, reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счётчики избранного, корзин, рецептов и подписчиков '
+        'с данными и исправляет расходящиеся.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить, ничего не изменяя.',
+        )
+        parser.add_argument(
+            '--counters', nargs='+', choices=sorted(COUNTERS),
+            help='Сверить только эти счётчики.',
+        )
+
+    def handle(self, *args, **options):
+        names = options['counters'] or list(COUNTERS)
+        if options['check']:
+            drifted = {name: len(find_drift(name)) for name in names}
+        else:
+            drifted = reconcile(names)
+        drifted = {name: total for name, total in drifted.items() if total}
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS(
+                'Счётчики согласованы с данными.'
+            ))
+            return
+        summary = ', '.join(
+            f'{name}: {total}' for name, total in drifted.items()
+        )
+        if options['check']:
+            raise CommandError(f'Расхождения счётчиков: {summary}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлены счётчики: {summary}.'
+        ))
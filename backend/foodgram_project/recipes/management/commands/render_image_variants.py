@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import render_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Готовит уменьшенные копии картинок рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересчитать картинки и у рецептов, где они уже есть.',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(thumbnail='')
+        rendered = failed = 0
+        for recipe_id, image_name in recipes.values_list('id', 'image'):
+            try:
+                render_variants(recipe_id, image_name)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+            else:
+                rendered += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {rendered}, с ошибками: {failed}.'
+        ))
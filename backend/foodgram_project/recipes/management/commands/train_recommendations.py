@@ -0,0 +1,163 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from scipy import sparse
+
+from recipes.models import (FavoriteRecipes, Recipe, RecipeNeighbour,
+                            ShoppingCart)
+from recipes.recommendations import CART_WEIGHT, FAVORITE_WEIGHT, VERSION_NAME
+from recipes.versioning import bump_version
+
+WRITE_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        'Обучает модель «рекомендовано для вас»: по избранному и корзинам '
+        'считает косинусное сходство рецептов и сохраняет ближайших '
+        'соседей каждого рецепта.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbours', type=int, default=20,
+            help='Сколько соседей хранить для каждого рецепта.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько рецептов обрабатывать за одно умножение матриц.',
+        )
+        parser.add_argument(
+            '--min-common', type=int, default=2,
+            help='Минимальное число пользователей, у которых встретились '
+                 'оба рецепта.',
+        )
+        parser.add_argument(
+            '--shrink', type=float, default=10.0,
+            help='Сглаживание: сходство умножается на n / (n + shrink), '
+                 'где n — число общих пользователей.',
+        )
+
+    def handle(self, *args, **options):
+        self.started = time.monotonic()
+        if options['neighbours'] < 1 or options['batch_size'] < 1:
+            raise CommandError(
+                '--neighbours и --batch-size должны быть положительными.'
+            )
+        users, recipes, weights = self.interactions()
+        if not len(weights):
+            raise CommandError('Нет избранного и корзин: обучать не на чем.')
+        recipe_ids, columns = np.unique(recipes, return_inverse=True)
+        _, rows = np.unique(users, return_inverse=True)
+        matrix = sparse.csc_matrix(
+            (weights, (rows, columns)),
+            shape=(rows.max() + 1, len(recipe_ids)),
+        )
+        matrix.sum_duplicates()
+        self.stage(
+            f'взаимодействий: {len(weights)}, пользователей: '
+            f'{matrix.shape[0]}, рецептов: {matrix.shape[1]}'
+        )
+        sources, targets, scores = self.neighbours(matrix, options)
+        self.stage(f'соседей: {len(scores)}')
+        saved = self.save(recipe_ids[sources], recipe_ids[targets], scores)
+        bump_version(VERSION_NAME)
+        self.stage(f'сохранено: {saved}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - self.started:.1f} с.'
+        ))
+
+    def stage(self, message):
+        self.stdout.write(
+            f'[{time.monotonic() - self.started:7.1f} с] {message}'
+        )
+
+    def interactions(self):
+        users, recipes, weights = [], [], []
+        for model, weight in (
+            (FavoriteRecipes, FAVORITE_WEIGHT),
+            (ShoppingCart, CART_WEIGHT),
+        ):
+            pairs = np.array(
+                list(model.objects.values_list(
+                    'user_id', 'recipe_id'
+                ).iterator()),
+                dtype=np.int64,
+            ).reshape(-1, 2)
+            users.append(pairs[:, 0])
+            recipes.append(pairs[:, 1])
+            weights.append(np.full(len(pairs), weight))
+        return (
+            np.concatenate(users),
+            np.concatenate(recipes),
+            np.concatenate(weights),
+        )
+
+    def neighbours(self, matrix, options):
+        """Сходство считается блоками строк матрицы рецепты × рецепты,
+        чтобы не держать её в памяти целиком. В каждом блоке соседи
+        сортируются и обрезаются до --neighbours без цикла по рецептам."""
+        limit = options['neighbours']
+        shrink = options['shrink']
+        binary = matrix.copy()
+        binary.data[:] = 1
+        norms = np.sqrt(
+            np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel()
+        )
+        transposed = matrix.T.tocsr()
+        binary_transposed = binary.T.tocsr()
+        found = []
+        for start in range(0, matrix.shape[1], options['batch_size']):
+            stop = min(start + options['batch_size'], matrix.shape[1])
+            products = (transposed[start:stop] @ matrix).tocsr()
+            common = (binary_transposed[start:stop] @ binary).tocsr()
+            products.sort_indices()
+            common.sort_indices()
+            rows = np.repeat(
+                np.arange(start, stop), np.diff(products.indptr)
+            )
+            columns = products.indices
+            scores = (
+                products.data / (norms[rows] * norms[columns])
+                * common.data / (common.data + shrink)
+            )
+            keep = (columns != rows) & (common.data >= options['min_common'])
+            rows, columns, scores = rows[keep], columns[keep], scores[keep]
+            order = np.lexsort((-scores, rows))
+            rows, columns, scores = rows[order], columns[order], scores[order]
+            rank = np.arange(len(rows)) - np.searchsorted(rows, rows)
+            keep = rank < limit
+            found.append((rows[keep], columns[keep], scores[keep]))
+        return tuple(
+            np.concatenate([part[index] for part in found])
+            for index in range(3)
+        )
+
+    def save(self, sources, targets, scores):
+        with transaction.atomic():
+            existing = np.fromiter(
+                Recipe.objects.values_list('id', flat=True).iterator(),
+                dtype=np.int64,
+            )
+            keep = np.isin(sources, existing) & np.isin(targets, existing)
+            sources, targets, scores = (
+                sources[keep].tolist(),
+                targets[keep].tolist(),
+                scores[keep].tolist(),
+            )
+            RecipeNeighbour.objects.all().delete()
+            for start in range(0, len(scores), WRITE_BATCH_SIZE):
+                stop = start + WRITE_BATCH_SIZE
+                RecipeNeighbour.objects.bulk_create(
+                    RecipeNeighbour(
+                        recipe_id=source, neighbour_id=target, score=score
+                    )
+                    for source, target, score in zip(
+                        sources[start:stop],
+                        targets[start:stop],
+                        scores[start:stop],
+                    )
+                )
+        return len(scores)
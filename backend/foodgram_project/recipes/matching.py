@@ -0,0 +1,158 @@
+from collections import defaultdict, namedtuple
+
+from .indexes import RecipeIndex
+from .models import RecipeIngredient
+
+RecipeMatch = namedtuple('RecipeMatch', ('id', 'coverage', 'missing'))
+
+
+def bitmask(ids, length):
+    array = bytearray(length)
+    for pk in ids:
+        if pk >> 3 < length:
+            array[pk >> 3] |= 1 << (pk & 7)
+    return int.from_bytes(array, 'little')
+
+
+class RecipeIngredientIndex(RecipeIndex):
+    """Для каждого ингредиента — битовая маска рецептов, где номер бита
+    равен id рецепта, для каждого числа ингредиентов в рецепте — маска
+    рецептов с таким числом. Совпадения считаются поразрядным сложением
+    масок выбранных ингредиентов, без перебора рецептов по одному."""
+
+    rebuild_threshold = 1000
+
+    def __init__(self):
+        super().__init__()
+        self.recipes = {}
+        self.bitsets = {}
+        self.sizes = {}
+
+    def load(self, recipes):
+        changed = {
+            pk: set() for pk in recipes.values_list('id', flat=True).iterator()
+        }
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe__in=recipes.values('id')
+        ).values_list('recipe_id', 'ingredients_id').iterator():
+            changed.setdefault(recipe_id, set()).add(ingredient_id)
+        if len(changed) <= self.rebuild_threshold:
+            for pk, ingredients in changed.items():
+                self.add(pk, ingredients)
+            return
+        self.recipes.update(
+            (pk, frozenset(ingredients))
+            for pk, ingredients in changed.items()
+        )
+        self.rebuild()
+
+    def rebuild(self):
+        length = (max(self.recipes, default=0) >> 3) + 1
+        bitsets = defaultdict(lambda: bytearray(length))
+        sizes = defaultdict(lambda: bytearray(length))
+        for pk, ingredients in self.recipes.items():
+            index, bit = pk >> 3, 1 << (pk & 7)
+            sizes[len(ingredients)][index] |= bit
+            for ingredient_id in ingredients:
+                bitsets[ingredient_id][index] |= bit
+        self.bitsets = {
+            key: int.from_bytes(array, 'little')
+            for key, array in bitsets.items()
+        }
+        self.sizes = {
+            key: int.from_bytes(array, 'little')
+            for key, array in sizes.items()
+        }
+
+    def indexed_ids(self):
+        return self.recipes.keys()
+
+    def add(self, pk, ingredients):
+        self.remove(pk)
+        ingredients = frozenset(ingredients)
+        bit = 1 << pk
+        for ingredient_id in ingredients:
+            self.bitsets[ingredient_id] = (
+                self.bitsets.get(ingredient_id, 0) | bit
+            )
+        size = len(ingredients)
+        self.sizes[size] = self.sizes.get(size, 0) | bit
+        self.recipes[pk] = ingredients
+
+    def remove(self, pk):
+        ingredients = self.recipes.pop(pk, None)
+        if ingredients is None:
+            return
+        bit = 1 << pk
+        for key, masks in (
+            *((ingredient_id, self.bitsets) for ingredient_id in ingredients),
+            (len(ingredients), self.sizes),
+        ):
+            masks[key] ^= bit
+            if not masks[key]:
+                del masks[key]
+
+    def match(self, ingredient_ids, limit, max_missing=None, allowed=None):
+        """Рецепты, в которых есть хотя бы один из ингредиентов, по
+        убыванию доли имеющихся ингредиентов, затем по числу недостающих
+        и совпавших, затем от новых к старым. allowed ограничивает выбор
+        заранее отфильтрованными id рецептов."""
+        available = frozenset(ingredient_ids)
+        with self.lock:
+            self.refresh()
+            planes, union = self.count_hits(available)
+            if allowed is not None:
+                union &= bitmask(allowed, (union.bit_length() >> 3) + 1)
+            classes = sorted(
+                (
+                    (found / size, found - size, found, size)
+                    for size in self.sizes
+                    for found in range(1, min(size, len(available)) + 1)
+                    if max_missing is None or size - found <= max_missing
+                ),
+                reverse=True,
+            )
+            exact = {}
+            matches = []
+            for coverage, _, found, size in classes:
+                if found not in exact:
+                    exact[found] = self.exact_count(planes, union, found)
+                candidates = exact[found] & self.sizes[size]
+                while candidates and len(matches) < limit:
+                    pk = candidates.bit_length() - 1
+                    candidates ^= 1 << pk
+                    matches.append(RecipeMatch(
+                        pk, coverage, self.recipes[pk] - available
+                    ))
+                if len(matches) >= limit:
+                    break
+            return matches
+
+    def count_hits(self, ingredient_ids):
+        """Побитовые счётчики: i-я маска хранит i-й разряд числа
+        найденных ингредиентов для каждого рецепта."""
+        planes = []
+        union = 0
+        for ingredient_id in ingredient_ids:
+            carry = self.bitsets.get(ingredient_id, 0)
+            union |= carry
+            for index, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[index] = plane ^ carry
+                carry &= plane
+            if carry:
+                planes.append(carry)
+        return planes, union
+
+    @staticmethod
+    def exact_count(planes, union, found):
+        mask = union
+        for index, plane in enumerate(planes):
+            mask &= plane if found >> index & 1 else ~plane
+        if found >> len(planes):
+            return 0
+        return mask
+
+
+recipe_ingredient_index = RecipeIngredientIndex()
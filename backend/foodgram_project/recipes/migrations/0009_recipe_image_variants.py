@@ -0,0 +1,28 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='card_image',
+            field=models.ImageField(blank=True, upload_to='recipes/variants/', verbose_name='Картинка для карточки'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='full_image',
+            field=models.ImageField(blank=True, upload_to='recipes/variants/', verbose_name='Картинка для просмотра'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='recipes/variants/', verbose_name='Миниатюра'),
+        ),
+    ]
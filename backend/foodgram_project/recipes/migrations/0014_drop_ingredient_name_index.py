@@ -0,0 +1,31 @@
+from django.db import migrations
+
+INGREDIENT_NAME_INDEX = 'ingredient_name_upper_idx'
+
+
+def drop_ingredient_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INGREDIENT_NAME_INDEX}')
+
+
+def create_ingredient_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {INGREDIENT_NAME_INDEX} '
+            'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)'
+        )
+
+
+class Migration(migrations.Migration):
+    """Поиск ингредиентов больше не фильтрует по istartswith, поэтому
+    индекс по UPPER(name) только замедляет запись."""
+
+    dependencies = [
+        ('recipes', '0013_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            drop_ingredient_name_index, create_ingredient_name_index
+        ),
+    ]
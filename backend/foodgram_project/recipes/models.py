@@ -1,7 +1,9 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Sum
 
-from users.models import User
+from users.models import CountersMixin, User
 
 
 class Tag(models.Model):
@@ -55,7 +57,7 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(CountersMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -70,6 +72,21 @@ class Recipe(models.Model):
         upload_to='recipes/',
         verbose_name='Картинка'
     )
+    thumbnail = models.ImageField(
+        upload_to='recipes/variants/',
+        blank=True,
+        verbose_name='Миниатюра'
+    )
+    card_image = models.ImageField(
+        upload_to='recipes/variants/',
+        blank=True,
+        verbose_name='Картинка для карточки'
+    )
+    full_image = models.ImageField(
+        upload_to='recipes/variants/',
+        blank=True,
+        verbose_name='Картинка для просмотра'
+    )
     text = models.TextField(null=False, verbose_name='Описание')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -91,9 +108,46 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Время публикации'
     )
+    modified = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Время изменения'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах'
+    )
+
+    counter_fields = ('favorites_count', 'cart_count')
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=('favorites_count', 'pub_date', 'id'),
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=('cart_count', 'pub_date', 'id'),
+                name='recipe_cart_count_idx'
+            ),
+            models.Index(
+                fields=('pub_date', 'id'), name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=('author', 'pub_date'), name='recipe_author_date_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -119,6 +173,14 @@ class RecipeIngredient(models.Model):
         verbose_name='Количество'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=('recipe', 'ingredients'),
+                name='recipe_ingredient_idx'
+            ),
+        ]
+
 
 class RecipeTag(models.Model):
     tags = models.ForeignKey(
@@ -139,6 +201,9 @@ class RecipeTag(models.Model):
                 name='recipe_tag_unique'
             )
         ]
+        indexes = [
+            models.Index(fields=('tags', 'recipe'), name='tag_recipe_idx'),
+        ]
 
 
 class ShoppingCart(models.Model):
@@ -189,3 +254,192 @@ class FavoriteRecipes(models.Model):
         ]
         verbose_name = 'В избранном'
         verbose_name_plural = 'Избранные рецепты'
+
+
+class RecipeNeighbour(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='neighbours',
+        verbose_name='Рецепт'
+    )
+    neighbour = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'neighbour'),
+                name='recipe_neighbour_unique'
+            )
+        ]
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField(verbose_name='Время публикации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='user_timeline_unique'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_date_idx'
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+
+
+class ShoppingListManager(models.Manager):
+    batch_size = 500
+
+    def recipe_amounts(self, recipe):
+        return dict(
+            RecipeIngredient.objects.filter(recipe=recipe).values_list(
+                'ingredients'
+            ).annotate(total=Sum('amount')).order_by()
+        )
+
+    def add_recipe(self, user, recipe):
+        self.apply_delta([user.id], self.recipe_amounts(recipe))
+
+    def remove_recipe(self, user, recipe):
+        self.apply_delta([user.id], {
+            ingredient: -amount
+            for ingredient, amount in self.recipe_amounts(recipe).items()
+        })
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        delta = {
+            ingredient: new_amounts.get(ingredient, 0)
+            - old_amounts.get(ingredient, 0)
+            for ingredient in old_amounts.keys() | new_amounts.keys()
+        }
+        delta = {
+            ingredient: amount for ingredient, amount in delta.items()
+            if amount
+        }
+        if not delta:
+            return
+        user_ids = list(ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user', flat=True))
+        for start in range(0, len(user_ids), self.batch_size):
+            self.apply_delta(
+                user_ids[start:start + self.batch_size], delta
+            )
+
+    def apply_delta(self, user_ids, delta):
+        if not user_ids or not delta:
+            return
+        with transaction.atomic():
+            list(User.objects.select_for_update().filter(
+                pk__in=user_ids
+            ).order_by('pk').values_list('pk', flat=True))
+            existing = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.filter(
+                    user_id__in=user_ids, ingredient_id__in=delta
+                )
+            }
+            created, updated, deleted = [], [], []
+            for user_id in user_ids:
+                for ingredient_id, amount in delta.items():
+                    item = existing.get((user_id, ingredient_id))
+                    if item is None:
+                        if amount > 0:
+                            created.append(self.model(
+                                user_id=user_id,
+                                ingredient_id=ingredient_id,
+                                amount=amount
+                            ))
+                        continue
+                    item.amount += amount
+                    if item.amount > 0:
+                        updated.append(item)
+                    else:
+                        deleted.append(item.pk)
+            self.bulk_create(created)
+            self.bulk_update(updated, ('amount',))
+            self.filter(pk__in=deleted).delete()
+
+    def expected_totals(self, user_ids=None):
+        lookup = {'recipe__shopping_cart__isnull': False}
+        if user_ids is not None:
+            lookup = {'recipe__shopping_cart__user__in': user_ids}
+        return RecipeIngredient.objects.filter(**lookup).values_list(
+            'recipe__shopping_cart__user', 'ingredients'
+        ).annotate(total=Sum('amount')).order_by(
+            'recipe__shopping_cart__user_id', 'ingredients_id'
+        )
+
+    def rebuild(self, user_ids=None):
+        with transaction.atomic():
+            items = self.all()
+            if user_ids is not None:
+                items = items.filter(user_id__in=user_ids)
+            items.delete()
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount
+                    )
+                    for user_id, ingredient_id, amount
+                    in self.expected_totals(user_ids).iterator()
+                ),
+                batch_size=self.batch_size
+            )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    objects = ShoppingListManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='user_ingredient_shoppinglist_unique'
+            )
+        ]
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Сводный список покупок'
@@ -0,0 +1,77 @@
+import heapq
+from collections import defaultdict
+
+from users.models import Subscription
+
+from .models import FavoriteRecipes, Recipe, RecipeNeighbour, ShoppingCart
+from .versioning import get_version
+
+FAVORITE_WEIGHT = 1.0
+CART_WEIGHT = 0.5
+SUBSCRIPTION_WEIGHT = 0.3
+SEEDS_LIMIT = 50
+VERSION_NAME = 'recommendations'
+
+
+def model_version():
+    """Меняется после каждого запуска train_recommendations."""
+    return get_version(VERSION_NAME)
+
+
+def subscribed_recipes(user):
+    return Recipe.objects.filter(
+        author__in=Subscription.objects.filter(user=user).values('author')
+    ).order_by('-pub_date')
+
+
+def seed_weights(user):
+    """Последние рецепты из избранного и корзины пользователя и свежие
+    рецепты авторов, на которых он подписан, с весами."""
+    seeds = defaultdict(float)
+    for queryset, weight in (
+        (FavoriteRecipes.objects.filter(user=user), FAVORITE_WEIGHT),
+        (ShoppingCart.objects.filter(user=user), CART_WEIGHT),
+    ):
+        for recipe_id in queryset.order_by('-id').values_list(
+            'recipe_id', flat=True
+        )[:SEEDS_LIMIT]:
+            seeds[recipe_id] += weight
+    for recipe_id in subscribed_recipes(user).values_list(
+        'id', flat=True
+    )[:SEEDS_LIMIT]:
+        seeds[recipe_id] += SUBSCRIPTION_WEIGHT
+    return seeds
+
+
+def recommend(user, limit, exclude=frozenset()):
+    """Id рецептов для пользователя: сливает списки соседей из модели
+    train_recommendations, суммируя сходство с весом рецепта-источника.
+    Без соседей — свежие рецепты подписок, затем просто свежие.
+    Собственные рецепты пользователя не предлагаются."""
+    exclude = exclude | set(
+        Recipe.objects.filter(author=user).values_list('id', flat=True)
+    )
+    seeds = seed_weights(user)
+    scores = defaultdict(float)
+    for recipe_id, neighbour_id, score in RecipeNeighbour.objects.filter(
+        recipe__in=seeds
+    ).values_list('recipe_id', 'neighbour_id', 'score').iterator():
+        if neighbour_id not in exclude:
+            scores[neighbour_id] += seeds[recipe_id] * score
+    ranked = heapq.nlargest(
+        limit, scores, key=lambda pk: (scores[pk], pk)
+    )
+    if len(ranked) >= limit:
+        return ranked
+    seen = {*exclude, *ranked}
+    for fallback in (
+        subscribed_recipes(user),
+        Recipe.objects.order_by('-pub_date'),
+    ):
+        for pk in fallback.values_list('id', flat=True)[:limit + len(seen)]:
+            if pk not in seen:
+                ranked.append(pk)
+                seen.add(pk)
+                if len(ranked) >= limit:
+                    return ranked
+    return ranked
@@ -0,0 +1,151 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+
+from .indexes import RecipeIndex
+from .stemmer import stem
+
+WORD = re.compile(r'\w+')
+STOP_WORDS = frozenset((
+    'а', 'в', 'во', 'да', 'для', 'до', 'же', 'за', 'и', 'из', 'или', 'к',
+    'ко', 'на', 'не', 'но', 'о', 'об', 'от', 'по', 'под', 'при', 'с', 'со',
+    'у',
+))
+NAME_WEIGHT = 3
+K1 = 1.2
+B = 0.75
+SEARCH_CONFIG = 'russian'
+
+
+def tokenize(text):
+    return [
+        stem(word) for word in WORD.findall(text.casefold())
+        if word not in STOP_WORDS
+    ]
+
+
+def use_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipes):
+    """Пересчитывает tsvector рецептов; вне PostgreSQL ничего не делает."""
+    if use_postgres():
+        recipes.update(search_vector=search_vector())
+
+
+class RecipeSearchIndex(RecipeIndex):
+    """Обратный индекс рецептов для BM25 без PostgreSQL."""
+
+    def __init__(self):
+        super().__init__()
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.total_length = 0
+
+    def load(self, recipes):
+        for pk, name, text in recipes.values_list(
+            'id', 'name', 'text'
+        ).iterator():
+            self.add(pk, name, text)
+
+    def indexed_ids(self):
+        return self.documents.keys()
+
+    def add(self, pk, name, text):
+        self.remove(pk)
+        frequencies = Counter(tokenize(text))
+        for term in tokenize(name):
+            frequencies[term] += NAME_WEIGHT
+        for term, frequency in frequencies.items():
+            self.postings[term][pk] = frequency
+        length = sum(frequencies.values())
+        self.documents[pk] = (tuple(frequencies), length)
+        self.total_length += length
+
+    def remove(self, pk):
+        document = self.documents.pop(pk, None)
+        if document is None:
+            return
+        terms, length = document
+        for term in terms:
+            postings = self.postings[term]
+            postings.pop(pk, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= length
+
+    def search(self, query):
+        """Id рецептов, содержащих все слова запроса, по убыванию BM25."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self.lock:
+            self.refresh()
+            postings = [self.postings.get(term, {}) for term in terms]
+            if not all(postings):
+                return []
+            total = len(self.documents)
+            average = self.total_length / total
+            weighted = sorted(
+                (
+                    (docs, math.log(
+                        1 + (total - len(docs) + 0.5) / (len(docs) + 0.5)
+                    ))
+                    for docs in postings
+                ),
+                key=lambda item: len(item[0]),
+            )
+            scores = {}
+            for pk in weighted[0][0]:
+                if not all(pk in docs for docs, _ in weighted[1:]):
+                    continue
+                norm = K1 * (1 - B + B * self.documents[pk][1] / average)
+                scores[pk] = sum(
+                    idf * docs[pk] * (K1 + 1) / (docs[pk] + norm)
+                    for docs, idf in weighted
+                )
+        return sorted(scores, key=lambda pk: (-scores[pk], -pk))
+
+
+recipe_search_index = RecipeSearchIndex()
+
+
+def search_recipes(queryset, query):
+    """Рецепты из queryset, подходящие под запрос, по убыванию
+    релевантности: tsvector и GIN-индекс в PostgreSQL,
+    индекс в памяти процесса на остальных СУБД."""
+    limit = settings.RECIPE_SEARCH_LIMIT
+    if use_postgres():
+        search_query = SearchQuery(query, config=SEARCH_CONFIG)
+        return list(
+            queryset.filter(search_vector=search_query).annotate(
+                rank=SearchRank(
+                    'search_vector',
+                    search_query,
+                    cover_density=True,
+                    normalization=1,
+                )
+            ).order_by('-rank', '-pk')[:limit]
+        )
+    ranked = recipe_search_index.search(query)
+    found = []
+    for start in range(0, len(ranked), limit):
+        chunk = ranked[start:start + limit]
+        recipes = queryset.order_by().in_bulk(chunk)
+        found.extend(recipes[pk] for pk in chunk if pk in recipes)
+        if len(found) >= limit:
+            break
+    return found[:limit]
@@ -0,0 +1,121 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import User
+
+from .counters import COUNTERS, defer_change
+from .models import Ingredient, Recipe, ShoppingListItem, Tag
+from .search import update_search_vectors
+from .timeline import fan_out
+from .versioning import bump_version
+
+
+def bump_recipes_version():
+    transaction.on_commit(lambda: bump_version('recipes'))
+
+
+def touch_recipes(recipes):
+    """Обновляет отметку изменения рецептов, чьё представление
+    зависит от изменённых связанных данных."""
+    if recipes.update(modified=timezone.now()):
+        bump_recipes_version()
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_shopping_lists(sender, instance, **kwargs):
+    ShoppingListItem.objects.change_recipe(
+        instance, ShoppingListItem.objects.recipe_amounts(instance), {}
+    )
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, **kwargs):
+    bump_recipes_version()
+
+
+@receiver(post_save, sender=Recipe)
+def push_recipe_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: fan_out(instance))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, update_fields, **kwargs):
+    if update_fields is None or {'name', 'text'} & update_fields:
+        update_search_vectors(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    bump_version('ingredients')
+
+
+@receiver((post_save, pre_delete), sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    bump_version('tags')
+
+
+@receiver((post_save, pre_delete), sender=Tag)
+def touch_tag_recipes(sender, instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    touch_recipes(Recipe.objects.filter(author=instance))
+
+
+def counted_keys(model):
+    """Счётчики, которые считают строки model, и поля model со ссылкой
+    на объект со счётчиком."""
+    return [
+        (name, f'{key}_id')
+        for name, (_, related, key) in COUNTERS.items()
+        if related is model
+    ]
+
+
+def remember_counted_keys(sender, instance, raw, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._counted_keys = sender.objects.filter(pk=instance.pk).values(
+        *(key for _, key in counted_keys(sender))
+    ).first()
+
+
+def count_saved(sender, instance, created, raw, **kwargs):
+    """Счётчики меняются при любом сохранении и удалении, в том числе
+    из админки и при каскадном удалении."""
+    if raw:
+        return
+    old = getattr(instance, '_counted_keys', None) or {}
+    for name, key in counted_keys(sender):
+        target = getattr(instance, key)
+        if created:
+            defer_change(name, target, 1)
+        elif key in old and old[key] != target:
+            defer_change(name, old[key], -1)
+            defer_change(name, target, 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    for name, key in counted_keys(sender):
+        defer_change(name, getattr(instance, key), -1)
+
+
+# Только для моделей, строки которых считаются: обработчик удаления без
+# sender отключил бы быстрое удаление для всех моделей.
+for counted in {related for _, related, _ in COUNTERS.values()}:
+    pre_save.connect(remember_counted_keys, sender=counted)
+    post_save.connect(count_saved, sender=counted)
+    post_delete.connect(count_deleted, sender=counted)
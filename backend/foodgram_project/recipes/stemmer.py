@@ -0,0 +1,114 @@
+"""Стеммер Snowball для русского языка (Porter, snowballstem.org)."""
+
+VOWELS = frozenset('аеиоуыэюя')
+
+PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись',
+                                             'ыв', 'ывши', 'ывшись'))
+REFLEXIVE = ((), ('ся', 'сь'))
+ADJECTIVE = ((), (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею',
+))
+PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+VERB = (
+    (
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+    ),
+    (
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+        'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует',
+        'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    ),
+)
+NOUN = ((), (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и',
+    'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о',
+    'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+))
+DERIVATIONAL = ('ост', 'ость')
+SUPERLATIVE = ('ейш', 'ейше')
+
+
+def regions(word):
+    """Начала областей RV и R2."""
+    rv = r1 = r2 = len(word)
+    for index, letter in enumerate(word):
+        if letter in VOWELS:
+            rv = index + 1
+            break
+    for index in range(1, len(word)):
+        if word[index - 1] in VOWELS and word[index] not in VOWELS:
+            r1 = index + 1
+            break
+    for index in range(r1 + 1, len(word)):
+        if word[index - 1] in VOWELS and word[index] not in VOWELS:
+            r2 = index + 1
+            break
+    return rv, r2
+
+
+def remove_ending(word, groups):
+    """Отрезает самое длинное окончание из групп. Окончания первой
+    группы допустимы только после «а» или «я». Возвращает None,
+    если подходящего окончания нет."""
+    found = max(
+        (
+            (len(ending), group)
+            for group, endings in enumerate(groups)
+            for ending in endings
+            if word.endswith(ending)
+        ),
+        default=None,
+    )
+    if found is None:
+        return None
+    length, group = found
+    rest = word[:-length]
+    if group == 0 and not rest.endswith(('а', 'я')):
+        return None
+    return rest
+
+
+def optional(stemmed, word):
+    return word if stemmed is None else stemmed
+
+
+def remove_inflection(word):
+    stemmed = remove_ending(word, PERFECTIVE_GERUND)
+    if stemmed is not None:
+        return stemmed
+    word = optional(remove_ending(word, REFLEXIVE), word)
+    stemmed = remove_ending(word, ADJECTIVE)
+    if stemmed is not None:
+        return optional(remove_ending(stemmed, PARTICIPLE), stemmed)
+    for groups in (VERB, NOUN):
+        stemmed = remove_ending(word, groups)
+        if stemmed is not None:
+            return stemmed
+    return word
+
+
+def tidy_up(word):
+    for ending in SUPERLATIVE[::-1]:
+        if word.endswith(ending):
+            word = word[:-len(ending)]
+            return word[:-1] if word.endswith('нн') else word
+    if word.endswith(('нн', 'ь')):
+        return word[:-1]
+    return word
+
+
+def stem(word):
+    word = word.casefold().replace('ё', 'е')
+    rv, r2 = regions(word)
+    prefix, word = word[:rv], word[rv:]
+    word = remove_inflection(word)
+    if word.endswith('и'):
+        word = word[:-1]
+    for ending in DERIVATIONAL:
+        if word.endswith(ending) and len(word) - len(ending) >= r2 - rv:
+            word = word[:-len(ending)]
+            break
+    return prefix + tidy_up(word)
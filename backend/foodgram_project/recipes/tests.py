@@ -0,0 +1,173 @@
+import random
+
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.testing import isolated_caches
+from users.models import Subscription, User
+
+from .counters import COUNTERS, find_drift
+from .matching import RecipeIngredientIndex
+from .models import (FavoriteRecipes, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart)
+
+ISOLATED_CACHE = isolated_caches('recipes-tests')
+
+
+def create_user(name):
+    return User.objects.create_user(
+        username=name, email=f'{name}@foodgram.local', password=None
+    )
+
+
+def create_recipe(author, name='recipe'):
+    return Recipe.objects.create(
+        author=author, name=name, image='recipes/test.png', text='text',
+        cooking_time=10,
+    )
+
+
+@override_settings(CACHES=ISOLATED_CACHE)
+class CountersTest(TestCase):
+    """Счётчики обновляются сигналами, в том числе при каскадном
+    удалении, одним UPDATE на группу объектов."""
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.fans = [create_user(f'fan-{index}') for index in range(5)]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipes = [
+                create_recipe(self.author, f'recipe {index}')
+                for index in range(3)
+            ]
+            for fan in self.fans:
+                Subscription.objects.create(user=fan, author=self.author)
+                for recipe in self.recipes:
+                    FavoriteRecipes.objects.create(user=fan, recipe=recipe)
+                    ShoppingCart.objects.create(user=fan, recipe=recipe)
+
+    def assert_no_drift(self):
+        for name in COUNTERS:
+            self.assertEqual(find_drift(name), [], name)
+
+    def test_counts_saved_rows(self):
+        self.assert_no_drift()
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        self.assertEqual(recipe.favorites_count, 5)
+        self.assertEqual(recipe.cart_count, 5)
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual(author.recipes_count, 3)
+        self.assertEqual(author.followers_count, 5)
+
+    def test_cascade_updates_are_grouped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fans[0].delete()
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.fans[1].delete()
+        updates = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('UPDATE')
+            and 'count' in query['sql']
+        ]
+        self.assertEqual(len(updates), 3)
+        self.assert_no_drift()
+
+    def test_rolled_back_savepoint_is_not_counted(self):
+        recipe = self.recipes[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteRecipes.objects.filter(recipe=recipe).delete()
+            try:
+                with transaction.atomic():
+                    FavoriteRecipes.objects.create(
+                        user=self.fans[0], recipe=recipe
+                    )
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(Recipe.objects.get(pk=recipe.pk).favorites_count, 0)
+        self.assert_no_drift()
+
+
+@override_settings(CACHES=ISOLATED_CACHE)
+class RecipeIngredientIndexTest(TestCase):
+    """match на битовых масках совпадает с перебором рецептов
+    и пересечением множеств, включая порядок выдачи."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.random = random.Random(25)
+        author = create_user('author')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ingredient {index}', measurement_unit='г'
+            )
+            for index in range(12)
+        ]
+        cls.recipes = {}
+        for index in range(80):
+            recipe = create_recipe(author, f'recipe {index}')
+            ingredients = cls.random.sample(
+                cls.ingredients, cls.random.randint(1, 6)
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredients=ingredient, amount=10
+                )
+                for ingredient in ingredients
+            )
+            cls.recipes[recipe.pk] = frozenset(
+                ingredient.pk for ingredient in ingredients
+            )
+
+    def reference(self, available, limit, max_missing=None, allowed=None):
+        matches = []
+        for pk, ingredients in self.recipes.items():
+            found = len(ingredients & available)
+            size = len(ingredients)
+            if not found or allowed is not None and pk not in allowed:
+                continue
+            if max_missing is not None and size - found > max_missing:
+                continue
+            matches.append(
+                ((found / size, found - size, found, size, pk),
+                 (pk, found / size, ingredients - available))
+            )
+        matches.sort(reverse=True)
+        return [match for _, match in matches[:limit]]
+
+    def assert_matches_reference(self, index):
+        unknown = max(ingredient.pk for ingredient in self.ingredients) + 1
+        ids = [ingredient.pk for ingredient in self.ingredients] + [unknown]
+        self.assertEqual(index.match([], 10), [])
+        self.assertEqual(index.match([unknown], 10), [])
+        for _ in range(200):
+            available = frozenset(
+                self.random.sample(ids, self.random.randint(1, len(ids)))
+            )
+            limit = self.random.randint(1, 100)
+            max_missing = self.random.choice((None, 0, 1, 3))
+            allowed = self.random.choice((None, frozenset(
+                self.random.sample(list(self.recipes), 40)
+            )))
+            with self.subTest(
+                available=sorted(available), limit=limit,
+                max_missing=max_missing,
+            ):
+                self.assertEqual(
+                    [
+                        tuple(match) for match in index.match(
+                            available, limit, max_missing, allowed
+                        )
+                    ],
+                    self.reference(available, limit, max_missing, allowed),
+                )
+
+    def test_incremental_index(self):
+        self.assert_matches_reference(RecipeIngredientIndex())
+
+    def test_rebuilt_index(self):
+        index = RecipeIngredientIndex()
+        index.rebuild_threshold = 0
+        self.assert_matches_reference(index)
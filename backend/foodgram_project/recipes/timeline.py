@@ -0,0 +1,164 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from users.models import Subscription
+
+from .models import Recipe, TimelineEntry
+from .versioning import VersionedIndex, bump_version
+
+BATCH_SIZE = 500
+TRIM_SLACK = 50
+
+
+class PullAuthors(VersionedIndex):
+    """Авторы, у которых подписчиков больше TIMELINE_FANOUT_LIMIT:
+    их рецепты не рассылаются по лентам, а читаются при запросе."""
+
+    version_name = 'timeline_pull_authors'
+
+    def build(self):
+        return frozenset(
+            Subscription.objects.values('author').annotate(
+                total=Count('id')
+            ).filter(
+                total__gt=settings.TIMELINE_FANOUT_LIMIT
+            ).values_list('author', flat=True)
+        )
+
+    def sync(self, author):
+        """Сверяет автора с числом его подписчиков. Возвращает True,
+        если автор перестал быть читаемым при запросе и его рецепты
+        нужно разослать подписчикам."""
+        followers = Subscription.objects.filter(author=author).count()
+        pulled = author.pk in self.get()
+        if pulled == (followers > settings.TIMELINE_FANOUT_LIMIT):
+            return False
+        bump_version(self.version_name)
+        return pulled
+
+
+pull_authors = PullAuthors()
+
+
+def batches(items, size=BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def trim(user_ids):
+    """Обрезает ленты до TIMELINE_LENGTH записей. Ленты длиннее
+    не больше чем на TRIM_SLACK не трогает, чтобы не обрезать
+    их после каждого нового рецепта."""
+    length = settings.TIMELINE_LENGTH
+    overfull = TimelineEntry.objects.filter(user__in=user_ids).values(
+        'user'
+    ).annotate(total=Count('id')).filter(
+        total__gt=length + TRIM_SLACK
+    ).values_list('user', flat=True)
+    for user_id in list(overfull):
+        entries = TimelineEntry.objects.filter(user=user_id)
+        pub_date, recipe_id = entries.order_by(
+            '-pub_date', '-recipe'
+        ).values_list('pub_date', 'recipe')[length]
+        entries.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, recipe__lte=recipe_id)
+        ).delete()
+
+
+def push(user_ids, recipes):
+    for batch in batches(user_ids):
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=user_id, recipe_id=pk, pub_date=pub_date
+                )
+                for user_id in batch
+                for pk, pub_date in recipes
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        trim(batch)
+
+
+def latest_recipes(authors):
+    return list(Recipe.objects.filter(author__in=authors).order_by(
+        '-pub_date', '-pk'
+    ).values_list('pk', 'pub_date')[:settings.TIMELINE_LENGTH])
+
+
+def fan_out(recipe):
+    """Рассылает новый рецепт по лентам подписчиков автора."""
+    if recipe.author_id in pull_authors.get():
+        return
+    push(
+        Subscription.objects.filter(author=recipe.author_id).order_by(
+            'user'
+        ).values_list('user', flat=True).iterator(),
+        [(recipe.pk, recipe.pub_date)],
+    )
+
+
+def spread(author):
+    """Рассылает последние рецепты автора всем его подписчикам."""
+    push(
+        Subscription.objects.filter(author=author).order_by(
+            'user'
+        ).values_list('user', flat=True).iterator(),
+        latest_recipes([author]),
+    )
+
+
+def follow(user, author):
+    """Дополняет ленту нового подписчика последними рецептами автора."""
+    if pull_authors.sync(author):
+        spread(author)
+    elif author.pk not in pull_authors.get():
+        push([user.pk], latest_recipes([author]))
+
+
+def unfollow(user, author):
+    """Убирает рецепты автора из ленты бывшего подписчика."""
+    TimelineEntry.objects.filter(user=user, recipe__author=author).delete()
+    if pull_authors.sync(author):
+        spread(author)
+
+
+def rebuild(user_ids=None):
+    """Собирает ленты заново по текущим подпискам."""
+    bump_version(pull_authors.version_name)
+    entries = TimelineEntry.objects.all()
+    users = Subscription.objects.order_by('user').values_list(
+        'user', flat=True
+    ).distinct()
+    if user_ids is not None:
+        entries = entries.filter(user__in=user_ids)
+        users = users.filter(user__in=user_ids)
+    pulled = pull_authors.get()
+    with transaction.atomic():
+        entries.delete()
+        for user_id in list(users):
+            push([user_id], latest_recipes(
+                Subscription.objects.filter(user=user_id).exclude(
+                    author__in=pulled
+                ).values('author')
+            ))
+
+
+def timeline_sources(user, author_ids):
+    """Запросы, из которых складывается лента: записи, разосланные
+    пользователю, и рецепты авторов, читаемых при запросе, с полем,
+    которое служит вторым ключом сортировки."""
+    pulled = pull_authors.get() & author_ids
+    sources = [(TimelineEntry.objects.filter(user=user), 'recipe')]
+    if pulled:
+        sources.append((Recipe.objects.filter(author__in=pulled), 'pk'))
+    return sources
@@ -0,0 +1,64 @@
+import threading
+import time
+from uuid import uuid4
+
+from django.core.cache import caches
+
+
+def version_key(name):
+    return f'version:{name}'
+
+
+def new_version():
+    return f'{time.time_ns()}-{uuid4().hex[:8]}'
+
+
+def version_time(version):
+    """Момент создания версии в секундах или None для старых токенов."""
+    try:
+        return int(version.split('-', 1)[0]) // 10 ** 9
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_version(name, timeout=None):
+    """Текущая версия; timeout задаётся для версий, которых много
+    и которые не нужно хранить вечно: истёкшая версия просто
+    создаётся заново, как после изменения данных."""
+    cache = caches['versions']
+    version = cache.get(version_key(name))
+    if version is None:
+        cache.add(version_key(name), new_version(), timeout)
+        version = cache.get(version_key(name))
+    return version
+
+
+def bump_version(name, timeout=None):
+    version = new_version()
+    caches['versions'].set(version_key(name), version, timeout)
+    return version
+
+
+class VersionedIndex:
+    """Данные в памяти процесса, которые пересобираются,
+    как только меняется версия version_name в общем кеше."""
+
+    version_name = None
+
+    def __init__(self):
+        self._state = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        raise NotImplementedError
+
+    def get(self):
+        version = get_version(self.version_name)
+        state = self._state
+        if state is None or state[0] != version:
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != version:
+                    state = (version, self.build())
+                    self._state = state
+        return state[1]
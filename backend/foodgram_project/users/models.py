@@ -7,7 +7,28 @@ ROLES = (
 )
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """Счётчики меняются только запросами update() с F(). Обычное
+    сохранение загруженного объекта их не записывает, чтобы не затереть
+    изменения, сделанные другими запросами после загрузки."""
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not self._state.adding
+            and not kwargs.get('force_insert')
+            and kwargs.get('update_fields') is None
+        ):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     email = models.EmailField(
         max_length=254,
         unique=True,
@@ -26,6 +47,18 @@ class User(AbstractUser):
         default='user',
         verbose_name='Роль пользователя'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
+
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         ordering = ('-pk',)
@@ -61,5 +94,10 @@ class Subscription(models.Model):
                 name='user_author_unique'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=('author', 'user'), name='subscription_author_idx'
+            ),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'